@@ -0,0 +1,265 @@
+# Vectorized evaluation of many positions at once with NumPy.
+#
+# Positions are turned into rows of 64 PIECE_CODES bytes, expanded to
+# (N, 12, 64) piece planes and scored a chunk at a time: material and
+# piece-square values from the same SQUARE_VALUES tables GameState uses,
+# plus a mobility term counted with shifts of 64-bit boards. NumPy
+# is optional for the rest of the project and only needed here.
+
+import argparse
+import itertools
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from evaluate import PIECE_VALUES, SQUARE_VALUES
+from game import GameState
+from pieces import PIECE_CODES, KNIGHT_STEPS, KING_STEPS, DIAGONAL_DIRS, STRAIGHT_DIRS
+
+# Plane order: white pawn .. king, then black pawn .. king
+PLANES = [(color, symbol) for color in "wb" for symbol in "pnbrqk"]
+
+DEFAULT_CHUNK = 4096
+
+# Centipawns per square a piece can move to
+MOBILITY_WEIGHT = 4
+
+# FEN placement -> PIECE_CODES bytes: digits are expanded to runs of
+# b"1" with bytes.replace, then a translate table maps letters to codes,
+# "1" to an empty square and any other byte to _BAD_SQUARE
+_FEN_RUNS = [(str(n).encode(), b"1" * n) for n in range(2, 9)]
+_BAD_SQUARE = 255
+_FEN_CODES = bytearray([_BAD_SQUARE] * 256)
+_FEN_CODES[ord("1")] = 0
+for (_color, _symbol), _code in PIECE_CODES.items():
+    _FEN_CODES[ord(_symbol.upper() if _color == 'w' else _symbol)] = _code
+_FEN_CODES = bytes(_FEN_CODES)
+
+if np is not None:
+    # Plane index of each piece code, -1 for an empty square
+    _CODE_PLANES = np.full(16, -1, dtype=np.int8)
+    for _i, _piece in enumerate(PLANES):
+        _CODE_PLANES[PIECE_CODES[_piece]] = _i
+
+    # Signed material and piece-square bonus of each piece code on each
+    # square, zero for empty squares
+    _MATERIAL = np.zeros((16, 64), dtype=np.int32)
+    _BONUS = np.zeros((16, 64), dtype=np.int32)
+    for (_color, _symbol), _code in PIECE_CODES.items():
+        _sign = 1 if _color == 'w' else -1
+        _MATERIAL[_code] = _sign * PIECE_VALUES[_symbol]
+        _BONUS[_code] = np.array(SQUARE_VALUES[_color][_symbol]) - _MATERIAL[_code]
+    _SQUARES = np.arange(64)
+    _FEN_TABLE = np.frombuffer(_FEN_CODES, dtype=np.uint8)
+
+    # Squares whose column survives a shift by dc columns without wrapping
+    _COLUMN_MASKS = {}
+    for _dc in (-2, -1, 0, 1, 2):
+        _mask = 0
+        for _sq in range(64):
+            if 0 <= (_sq & 7) - _dc < 8:
+                _mask |= 1 << _sq
+        _COLUMN_MASKS[_dc] = np.uint64(_mask)
+
+    _BYTE_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.int32)
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("batch evaluation needs NumPy (pip install numpy)")
+
+
+def _expand_fen(placement):
+    data = placement.encode("ascii")
+    for digit, run in _FEN_RUNS:
+        data = data.replace(digit, run)
+    return data
+
+
+def position_codes(position):
+    """
+    (64 PIECE_CODES bytes, white to move) for a GameState or FEN string.
+    """
+    if isinstance(position, GameState):
+        return bytes(position.board.encode()), position.turn == 'w'
+
+    fields = position.split()
+    ranks = [_expand_fen(rank) for rank in fields[0].split("/")] if fields else []
+    codes = b"".join(ranks).translate(_FEN_CODES)
+    if (len(fields) < 2 or len(ranks) != 8 or any(len(rank) != 8 for rank in ranks) or
+            _BAD_SQUARE in codes):
+        raise ValueError("bad FEN: %r" % position)
+    return codes, fields[1] == 'w'
+
+
+def encode_positions(positions):
+    """
+    (N, 64) uint8 codes and (N,) white-to-move flags for a list of
+    GameStates or FEN strings. The FEN boards of the whole list are
+    expanded and checked in a few array operations.
+    """
+    _require_numpy()
+    n = len(positions)
+    if all(isinstance(position, str) for position in positions):
+        fields = [position.split(None, 2) for position in positions]
+        try:
+            # Each rank becomes 8 squares and its "/", in one (n * 8, 9) array
+            data = _expand_fen("/".join([f[0] for f in fields]) + "/")
+            white_to_move = np.array([f[1] == 'w' for f in fields], dtype=bool)
+        except (IndexError, UnicodeEncodeError):
+            data = b""
+        if len(data) == 72 * n:
+            ranks = np.frombuffer(data, dtype=np.uint8).reshape(n * 8, 9)
+            codes = _FEN_TABLE[ranks[:, :8]].reshape(n, 64)
+            if (ranks[:, 8] == ord("/")).all() and not (codes == _BAD_SQUARE).any():
+                return codes, white_to_move
+
+    # Mixed input, or a bad FEN that position_codes will name
+    rows = [position_codes(position) for position in positions]
+    codes = np.frombuffer(b"".join(row for row, _ in rows), dtype=np.uint8)
+    return codes.reshape(-1, 64), np.array([white for _, white in rows], dtype=bool)
+
+
+def to_planes(codes):
+    """
+    (N, 64) uint8 PIECE_CODES -> (N, 12, 64) bool piece planes.
+    """
+    _require_numpy()
+    planes = _CODE_PLANES[codes]
+    return planes[:, None, :] == np.arange(12, dtype=np.int8)[None, :, None]
+
+
+def _popcount(bitboards):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bitboards).astype(np.int32)
+    # NumPy before 2.0: count per byte
+    return _BYTE_COUNTS[bitboards.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int32)
+
+
+def _shift(bitboards, dr, dc):
+    # Move every bit by (dr, dc) squares, dropping those that leave the
+    # board; bit row * 8 + col as in bitboard.py
+    shift = dr * 8 + dc
+    if shift > 0:
+        shifted = bitboards << np.uint64(shift)
+    else:
+        shifted = bitboards >> np.uint64(-shift)
+    return shifted & _COLUMN_MASKS[dc]
+
+
+def mobility(planes):
+    """
+    White minus black count of pseudo-legal destination squares for
+    knights, bishops, rooks, queens and kings, ignoring pins, checks and
+    castling. Returns an (N,) int32 array.
+
+    Works on one 64-bit board per plane. Shifting all pieces of a kind
+    one step in one direction never lands two of them on the same
+    square, so popcounts per step add up to per-piece counts.
+    """
+    _require_numpy()
+    n = planes.shape[0]
+    boards = np.packbits(planes, axis=2, bitorder='little').view(np.uint64).reshape(n, 12)
+    occupied = np.bitwise_or.reduce(boards, axis=1)
+    empty = ~occupied
+    score = np.zeros(n, dtype=np.int32)
+
+    for first, sign in ((0, 1), (6, -1)):
+        own = np.bitwise_or.reduce(boards[:, first:first + 6], axis=1)
+        targets = ~own
+        count = np.zeros(n, dtype=np.int32)
+
+        for steps, pieces in ((KNIGHT_STEPS, boards[:, first + 1]), (KING_STEPS, boards[:, first + 5])):
+            for dr, dc in steps:
+                count += _popcount(_shift(pieces, dr, dc) & targets)
+
+        queens = boards[:, first + 4]
+        for steps, sliders in ((DIAGONAL_DIRS, boards[:, first + 2] | queens),
+                               (STRAIGHT_DIRS, boards[:, first + 3] | queens)):
+            for dr, dc in steps:
+                frontier = sliders
+                for _ in range(7):
+                    frontier = _shift(frontier, dr, dc)
+                    count += _popcount(frontier & targets)
+                    frontier &= empty
+                    if not frontier.any():
+                        break
+
+        score += sign * count
+    return score
+
+
+def score_terms(codes):
+    """
+    White-relative (material, piece-square bonus, mobility) arrays for
+    (N, 64) codes.
+    """
+    _require_numpy()
+    material = _MATERIAL[codes, _SQUARES].sum(axis=1)
+    bonus = _BONUS[codes, _SQUARES].sum(axis=1)
+    return material, bonus, mobility(to_planes(codes))
+
+
+def evaluate_codes(codes, white_to_move, mobility_weight=MOBILITY_WEIGHT):
+    """
+    Scores from the side to move's point of view for (N, 64) codes. With
+    mobility_weight=0 they equal evaluate() of the same positions.
+    """
+    material, bonus, moves = score_terms(codes)
+    score = material + bonus + mobility_weight * moves
+    return np.where(white_to_move, score, -score)
+
+
+def evaluate_stream(positions, chunk_size=DEFAULT_CHUNK, mobility_weight=MOBILITY_WEIGHT):
+    """
+    Yield one score array per chunk of `positions` (GameStates or FEN
+    strings, from any iterable). Only one chunk is held at a time, so
+    memory does not grow with the input.
+    """
+    _require_numpy()
+    positions = iter(positions)
+    while True:
+        chunk = list(itertools.islice(positions, chunk_size))
+        if not chunk:
+            return
+        codes, white_to_move = encode_positions(chunk)
+        yield evaluate_codes(codes, white_to_move, mobility_weight)
+
+
+def evaluate_many(positions, chunk_size=DEFAULT_CHUNK, mobility_weight=MOBILITY_WEIGHT):
+    """
+    All scores of `positions` as one array.
+    """
+    _require_numpy()
+    chunks = list(evaluate_stream(positions, chunk_size, mobility_weight))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int32)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a file of FEN lines in batches")
+    parser.add_argument("path", help="one FEN per line, - for stdin")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK)
+    parser.add_argument("--mobility-weight", type=int, default=MOBILITY_WEIGHT)
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.path == "-" else open(args.path)
+    start = time.perf_counter()
+    count = 0
+    with source:
+        fens = (line for line in source if line.strip())
+        for scores in evaluate_stream(fens, args.chunk, args.mobility_weight):
+            sys.stdout.write("\n".join(map(str, scores.tolist())) + "\n")
+            count += len(scores)
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed > 0 else 0.0
+    sys.stderr.write("%d positions in %.2fs (%.0f/s)\n" % (count, elapsed, rate))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# Bitboard attack tables for tablebase.py's move generation.
+#
+# Squares are numbered row * 8 + col, the same layout as Board.grid,
+# so bit 0 is a8 and bit 63 is h1. The steps and directions are
+# pieces.py's, so these masks agree with its per-square tables.
+
+from pieces import KNIGHT_STEPS, KING_STEPS, PAWN_CAPTURE_STEPS, DIAGONAL_DIRS, STRAIGHT_DIRS
+
+
+def square(row, col):
+    return row * 8 + col
+
+
+def bit(row, col):
+    return 1 << (row * 8 + col)
+
+
+def lsb(mask):
+    return (mask & -mask).bit_length() - 1
+
+
+def msb(mask):
+    return mask.bit_length() - 1
+
+
+def squares(mask):
+    """
+    Yield the square numbers of all set bits, lowest first.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _step_table(steps):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        for dr, dc in steps:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                mask |= bit(r, c)
+        table.append(mask)
+    return table
+
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            mask |= bit(r, c)
+            r += dr
+            c += dc
+        table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _step_table(KNIGHT_STEPS)
+KING_ATTACKS = _step_table(KING_STEPS)
+
+# PAWN_ATTACKS[color][sq] is the set of squares a pawn of `color` on sq attacks.
+PAWN_ATTACKS = {color: _step_table(steps) for color, steps in PAWN_CAPTURE_STEPS.items()}
+
+
+# Rays that walk towards higher square numbers take their first blocker
+# from the lowest set bit, the others from the highest one.
+def _rays(dirs):
+    rays = []
+    for dr, dc in dirs:
+        positive = dr > 0 or (dr == 0 and dc > 0)
+        rays.append((_ray_table(dr, dc), positive))
+    return rays
+
+
+DIAGONAL_RAYS = _rays(DIAGONAL_DIRS)
+STRAIGHT_RAYS = _rays(STRAIGHT_DIRS)
+
+
+def _slider_attacks(rays, sq, occupied):
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = lsb(blockers) if positive else msb(blockers)
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def bishop_attacks(sq, occupied):
+    return _slider_attacks(DIAGONAL_RAYS, sq, occupied)
+
+
+def rook_attacks(sq, occupied):
+    return _slider_attacks(STRAIGHT_RAYS, sq, occupied)
+
+
+def queen_attacks(sq, occupied):
+    return (_slider_attacks(DIAGONAL_RAYS, sq, occupied) |
+            _slider_attacks(STRAIGHT_RAYS, sq, occupied))
+
@@ -1,9 +1,10 @@
 from pieces import *
 
 class Board:
-    def __init__(self):
+    def __init__(self, setup=True):
         self.grid = [[None for _ in range(8)] for _ in range(8)]
-        self.setup_starting_position()
+        if setup:
+            self.setup_starting_position()
 
     def setup_starting_position(self):
         layout = [
@@ -44,8 +45,48 @@ class Board:
     def place_piece(self, piece):
         self.grid[piece.row][piece.col] = piece
 
+    def remove_piece(self, row, col):
+        piece = self.grid[row][col]
+        if piece is not None:
+            self.grid[row][col] = None
+        return piece
+
     def move_piece(self, piece, to_row, to_col):
         self.grid[piece.row][piece.col] = None
         self.grid[to_row][to_col] = piece
         piece.move_to(to_row, to_col)
-        piece.has_moved = True
\ No newline at end of file
+        piece.has_moved = True
+
+    def encode(self):
+        """
+        The board as 64 bytes of PIECE_CODES, row by row from a8 to h1.
+        """
+        codes = bytearray(64)
+        i = 0
+        for row in self.grid:
+            for piece in row:
+                if piece is not None:
+                    codes[i] = PIECE_CODES[(piece.color, piece.symbol)]
+                i += 1
+        return codes
+
+    @classmethod
+    def decode(cls, codes):
+        """
+        Build a board from encode() output. Pawns off their start rank are
+        marked as moved; every other piece is marked as moved too, so the
+        caller restores castling rights by clearing has_moved on kings and rooks.
+        """
+        board = cls(setup=False)
+        for sq, code in enumerate(codes):
+            if not code:
+                continue
+            color, symbol = CODE_PIECES[code]
+            row, col = divmod(sq, 8)
+            piece = PIECE_CLASSES[symbol](color, row, col)
+            if symbol == 'p':
+                piece.has_moved = row != (6 if color == 'w' else 1)
+            else:
+                piece.has_moved = True
+            board.place_piece(piece)
+        return board
\ No newline at end of file
@@ -0,0 +1,195 @@
+# Opening book in a Polyglot-style binary file, read through mmap.
+#
+# The file is a sorted array of 16-byte big-endian entries: position
+# key, move, weight and a learn field that is left at zero. The layout
+# is Polyglot's, but the keys are this project's Zobrist keys and the
+# moves are encode_move() codes, so books from other programs cannot be
+# read and ours cannot be read by them.
+
+import argparse
+import mmap
+import random
+import struct
+import sys
+import time
+
+from game import GameState
+from gamedb import read_source, uci_to_code
+from notation import move_to_uci
+
+ENTRY = struct.Struct(">QHHI")
+_KEY = struct.Struct(">Q")
+
+# Plies of each game that go into a built book
+DEFAULT_MAX_PLY = 20
+
+# A move needs at least this many games behind it to be kept
+DEFAULT_MIN_GAMES = 2
+
+# Weight per game for the side that played the move
+_RESULT_POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}
+
+
+class OpeningBook:
+    """
+    Read-only book. Lookups binary-search the mapped file, so opening a
+    book costs nothing however large it is.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped
+            self.mm = b""
+        self.entries = len(self.mm) // ENTRY.size
+
+    def close(self):
+        if self.file is None:
+            return
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.entries
+
+    def _lower_bound(self, key):
+        mm = self.mm
+        lo, hi = 0, self.entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _KEY.unpack_from(mm, mid * ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def entries_for(self, key):
+        """
+        (move code, weight) of every entry for `key`, in file order.
+        """
+        found = []
+        i = self._lower_bound(key)
+        while i < self.entries:
+            entry_key, code, weight, _ = ENTRY.unpack_from(self.mm, i * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((code, weight))
+            i += 1
+        return found
+
+    def probe(self, state):
+        """
+        Book moves for `state` as ((piece, row, col, promotion), weight),
+        heaviest first. Entries that are not legal here, which a key
+        collision could produce, are dropped.
+        """
+        moves = []
+        for code, weight in self.entries_for(state.zobrist_key):
+            move = state.move_from_code(code)
+            if move is not None:
+                moves.append((move, weight))
+        moves.sort(key=lambda item: -item[1])
+        return moves
+
+    def choose(self, state, rng=random, best=False):
+        """
+        A book move picked at random in proportion to its weight (or the
+        heaviest one), or None when the position is not in the book.
+        """
+        moves = self.probe(state)
+        total = sum(weight for _, weight in moves)
+        if not moves or total == 0:
+            return None
+        if best:
+            return moves[0][0]
+
+        pick = rng.randrange(total)
+        for move, weight in moves:
+            pick -= weight
+            if pick < 0:
+                return move
+        return moves[-1][0]
+
+
+def build(sources, out_path, max_ply=DEFAULT_MAX_PLY, min_games=DEFAULT_MIN_GAMES):
+    """
+    Compile a book from the first `max_ply` plies of every game in
+    `sources` (PGN, self-play JSONL or game database files). Each move
+    is weighted by the score of the side that played it, 2 per win and
+    1 per draw. Returns the number of entries written.
+    """
+    # (key, code) -> [games, points]
+    stats = {}
+    for path in sources:
+        for moves, result, fen in read_source(path):
+            points = _RESULT_POINTS.get(result)
+            if points is None:
+                continue
+            state = GameState.from_fen(fen) if fen else GameState()
+            for uci in moves[:max_ply]:
+                try:
+                    code = uci_to_code(uci)
+                except ValueError:
+                    break
+                move = state.move_from_code(code)
+                if move is None:
+                    break
+                entry = stats.setdefault((state.zobrist_key, code), [0, 0])
+                entry[0] += 1
+                entry[1] += points[0] if state.turn == 'w' else points[1]
+                state.make_move(*move)
+
+    kept = sorted((key, code, points) for (key, code), (games, points) in stats.items()
+                  if games >= min_games and points > 0)
+
+    # Weights are 16 bits; scale down if the heaviest move needs it
+    top = max((points for _, _, points in kept), default=0)
+    scale = max(1.0, top / 0xFFFF)
+
+    with open(out_path, "wb") as out:
+        for key, code, points in kept:
+            out.write(ENTRY.pack(key, code, max(1, int(points / scale)), 0))
+    return len(kept)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query an opening book")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="compile a book from game files")
+    build_parser.add_argument("out")
+    build_parser.add_argument("sources", nargs="+", help=".pgn, self-play .jsonl or .db files")
+    build_parser.add_argument("--max-ply", type=int, default=DEFAULT_MAX_PLY)
+    build_parser.add_argument("--min-games", type=int, default=DEFAULT_MIN_GAMES)
+
+    probe_parser = sub.add_parser("probe", help="list the book moves of a position")
+    probe_parser.add_argument("book")
+    probe_parser.add_argument("--fen", help="default is the start position")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        entries = build(args.sources, args.out, args.max_ply, args.min_games)
+        print("%d entries -> %s in %.1fs" % (entries, args.out, time.perf_counter() - start))
+        return 0
+
+    state = GameState.from_fen(args.fen) if args.fen else GameState()
+    with OpeningBook(args.book) as book:
+        for move, weight in book.probe(state):
+            print("%s %d" % (move_to_uci(*move), weight))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# Static evaluation in centipawns: material plus piece-square tables.
+#
+# GameState keeps the white-relative score of its position in
+# `eval_score`, updated move by move from SQUARE_VALUES, so evaluate()
+# is a lookup. compute_score() rebuilds it from the board.
+
+PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 0}
+
+# Bonuses for white pieces, row 0 being rank 8 as in Board.grid.
+# Black uses the same tables flipped top to bottom.
+PIECE_SQUARE_TABLES = {
+    'p': [
+          0,   0,   0,   0,   0,   0,   0,   0,
+         50,  50,  50,  50,  50,  50,  50,  50,
+         10,  10,  20,  30,  30,  20,  10,  10,
+          5,   5,  10,  25,  25,  10,   5,   5,
+          0,   0,   0,  20,  20,   0,   0,   0,
+          5,  -5, -10,   0,   0, -10,  -5,   5,
+          5,  10,  10, -20, -20,  10,  10,   5,
+          0,   0,   0,   0,   0,   0,   0,   0,
+    ],
+    'n': [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    'b': [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    'r': [
+          0,   0,   0,   0,   0,   0,   0,   0,
+          5,  10,  10,  10,  10,  10,  10,   5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+          0,   0,   0,   5,   5,   0,   0,   0,
+    ],
+    'q': [
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+         -5,   0,   5,   5,   5,   5,   0,  -5,
+          0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+    ],
+    'k': [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+         20,  20,   0,   0,   0,   0,  20,  20,
+         20,  30,  10,   0,   0,  10,  30,  20,
+    ],
+}
+
+# SQUARE_VALUES[color][symbol][row * 8 + col]: material plus table bonus,
+# positive for white and negative for black
+SQUARE_VALUES = {
+    'w': {symbol: [PIECE_VALUES[symbol] + bonus for bonus in table]
+          for symbol, table in PIECE_SQUARE_TABLES.items()},
+    'b': {symbol: [-(PIECE_VALUES[symbol] + table[sq ^ 56]) for sq in range(64)]
+          for symbol, table in PIECE_SQUARE_TABLES.items()},
+}
+
+
+def compute_score(board):
+    """
+    Full O(64) white-relative score of a board. GameState keeps
+    `eval_score` up to date incrementally; this is the reference.
+    """
+    score = 0
+    for r, row in enumerate(board.grid):
+        for c, piece in enumerate(row):
+            if piece is not None:
+                score += SQUARE_VALUES[piece.color][piece.symbol][r * 8 + c]
+    return score
+
+
+def evaluate(state, full=False):
+    """
+    Score from the point of view of the side to move. With full=True
+    the board is rescanned instead of reading the incremental score,
+    which is slower but useful to check it.
+    """
+    score = compute_score(state.board) if full else state.eval_score
+    return score if state.turn == 'w' else -score
@@ -1,15 +1,244 @@
+from collections import namedtuple
+from functools import lru_cache
+
 from board import Board
-from pieces import King, Queen, Rook, Bishop, Knight
+from pieces import (
+    Queen, Rook, Bishop, Knight, PIECE_CLASSES,
+    KNIGHT_TARGETS, KING_TARGETS, PAWN_CAPTURES, BISHOP_RAYS, ROOK_RAYS,
+)
+from zobrist import (
+    PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, CASTLING_SQUARES,
+    castling_rights, en_passant_key, compute_key,
+)
+from notation import square_name, parse_square
+from evaluate import SQUARE_VALUES, compute_score
+
+# One entry of GameState.move_history, holding everything unmake_move
+# needs to take the move back: the captured piece (which still knows its
+# square), the mover's has_moved flag and castling rook for castling
+# rights, the previous en-passant target, move counters, Zobrist key and
+# evaluation score, and the piece a pawn was promoted to.
+UndoRecord = namedtuple("UndoRecord", [
+    "piece", "from_row", "from_col", "to_row", "to_col", "captured",
+    "had_moved", "rook", "en_passant_target",
+    "halfmove_clock", "fullmove_number", "key", "score", "promoted",
+])
+
+PROMOTION_PIECES = ('q', 'r', 'b', 'n')
+
+# Promotion piece <-> 3-bit code used in 16-bit encoded moves
+_PROMOTION_CODES = {None: 0, 'n': 1, 'b': 2, 'r': 3, 'q': 4}
+_CODE_PROMOTIONS = {code: piece for piece, code in _PROMOTION_CODES.items()}
+
+def encode_move(from_row, from_col, to_row, to_col, promotion=None):
+    """
+    Pack a move into 16 bits: to-square in bits 0-5, from-square in
+    bits 6-11 and the promotion piece in bits 12-14.
+    """
+    return (_PROMOTION_CODES[promotion] << 12 |
+            (from_row * 8 + from_col) << 6 |
+            to_row * 8 + to_col)
+
+def decode_move(code):
+    """
+    Returns (from_row, from_col, to_row, to_col, promotion).
+    """
+    from_sq = code >> 6 & 63
+    to_sq = code & 63
+    return (from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7,
+            _CODE_PROMOTIONS[code >> 12 & 7])
+
+# FEN piece letter -> (piece class, color)
+_FEN_PIECES = {}
+for _symbol, _cls in PIECE_CLASSES.items():
+    _FEN_PIECES[_symbol.upper()] = (_cls, 'w')
+    _FEN_PIECES[_symbol] = (_cls, 'b')
+
+_CASTLING_LETTERS = {1: 'K', 2: 'Q', 4: 'k', 8: 'q'}
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+@lru_cache(maxsize=8192)
+def _parse_fen_rank(r, rank):
+    """
+    Parse one FEN rank on row r into ((col, class, color, has_moved), ...),
+    its Zobrist piece key and its evaluation score, or (None, 0, 0) if it
+    is malformed. Bulk FEN loads repeat the same ranks a lot, so results
+    are cached.
+    """
+    pieces = []
+    key = 0
+    score = 0
+    c = 0
+    for ch in rank:
+        if ch in _FEN_PIECES:
+            if c > 7:
+                return None, 0, 0
+            piece_cls, color = _FEN_PIECES[ch]
+            # Pawns can double-step from their start rank only; kings and
+            # rooks get has_moved cleared by from_fen from the castling rights
+            has_moved = piece_cls.symbol != 'p' or r != (6 if color == 'w' else 1)
+            pieces.append((c, piece_cls, color, has_moved))
+            key ^= PIECE_KEYS[color][piece_cls.symbol][r * 8 + c]
+            score += SQUARE_VALUES[color][piece_cls.symbol][r * 8 + c]
+            c += 1
+        elif '1' <= ch <= '8':
+            c += ord(ch) - 48
+        else:
+            return None, 0, 0
+    if c != 8:
+        return None, 0, 0
+    return tuple(pieces), key, score
+
+def _restore_castling(grid, rights):
+    """
+    Clear has_moved on the king and rook behind each right in the
+    castling_rights() mask `rights`, where both are on their home squares.
+    """
+    for mask, color, row, rook_col in CASTLING_SQUARES:
+        if not rights & mask:
+            continue
+        king = grid[row][4]
+        rook = grid[row][rook_col]
+        if (king is not None and king.symbol == 'k' and king.color == color and
+                rook is not None and rook.symbol == 'r' and rook.color == color):
+            king.has_moved = False
+            rook.has_moved = False
 
 class GameState:
     def __init__(self):
-        self.board = Board()
-        self.turn = 'w'
+        self._reset(Board())
+
+    def _reset(self, board, turn='w', en_passant_target=None,
+               halfmove_clock=0, fullmove_number=1, zobrist_key=None, eval_score=None):
+        self.board = board
+        self.turn = turn
         self.move_history = []
-        self.en_passant_target = None
+        self.en_passant_target = en_passant_target
         self.promotion_pending = None
-        self.halfmove_clock = 0
-        self.fullmove_number = 1
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        # 64-bit position key, updated incrementally, see zobrist.py
+        self.zobrist_key = compute_key(self) if zobrist_key is None else zobrist_key
+        # White-relative material and piece-square score, see evaluate.py
+        self.eval_score = compute_score(board) if eval_score is None else eval_score
+        self._clear_repetitions()
+        self._cache_id = None
+        self._cache = {}
+
+    @classmethod
+    def from_fen(cls, fen):
+        """
+        Build a position from a FEN string. The move counters may be left
+        out. Castling rights become has_moved flags on the kings and rooks.
+        Raises ValueError for malformed input.
+        """
+        fields = fen.split()
+        if len(fields) < 4 or len(fields) > 6:
+            raise ValueError("FEN needs 4 to 6 fields: %r" % fen)
+        placement, turn, castling, ep = fields[:4]
+
+        if turn != 'w' and turn != 'b':
+            raise ValueError("bad side to move in FEN: %r" % fen)
+
+        ranks = placement.split('/')
+        if len(ranks) != 8:
+            raise ValueError("FEN placement needs 8 ranks: %r" % fen)
+
+        board = Board(setup=False)
+        grid = board.grid
+        key = 0
+        score = 0
+
+        for r, rank in enumerate(ranks):
+            pieces, rank_key, rank_score = _parse_fen_rank(r, rank)
+            if pieces is None:
+                raise ValueError("bad FEN rank %r: %r" % (rank, fen))
+            key ^= rank_key
+            score += rank_score
+            row = grid[r]
+            for c, piece_cls, color, has_moved in pieces:
+                piece = piece_cls(color, r, c)
+                if has_moved:
+                    piece.has_moved = True
+                row[c] = piece
+
+        if castling != '-':
+            rights = 0
+            for mask, letter in _CASTLING_LETTERS.items():
+                if letter in castling:
+                    rights |= mask
+            _restore_castling(grid, rights)
+
+        en_passant_target = None
+        if ep != '-':
+            if len(ep) != 2 or ep[0] not in "abcdefgh" or ep[1] not in "36":
+                raise ValueError("bad en-passant square in FEN: %r" % fen)
+            en_passant_target = parse_square(ep)
+
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("bad move counters in FEN: %r" % fen)
+
+        state = cls.__new__(cls)
+        state._reset(board, turn, en_passant_target, halfmove_clock, fullmove_number, 0, score)
+
+        if turn == 'b':
+            key ^= SIDE_KEY
+        key ^= CASTLING_KEYS[castling_rights(board)]
+        state.zobrist_key = key ^ en_passant_key(state)
+        state._clear_repetitions()
+        return state
+
+    @classmethod
+    def from_board(cls, board, turn='w', castling=0, en_passant_target=None,
+                   halfmove_clock=0, fullmove_number=1):
+        """
+        Build a position around a Board from Board.decode(). `castling` is
+        a castling_rights() mask; its kings and rooks get has_moved cleared.
+        """
+        _restore_castling(board.grid, castling)
+        state = cls.__new__(cls)
+        state._reset(board, turn, en_passant_target, halfmove_clock, fullmove_number)
+        return state
+
+    def _clear_repetitions(self):
+        # Zobrist key -> times the position has occurred since the last
+        # pawn move or capture. Earlier positions can never come back, so
+        # an irreversible move pushes the map and starts an empty one.
+        self.repetitions = {self.zobrist_key: 1}
+        self._repetition_stack = []
+
+    def to_fen(self):
+        ranks = []
+        for row in self.board.grid:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece.symbol.upper() if piece.color == 'w' else piece.symbol
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        rights = castling_rights(self.board)
+        castling = "".join(letter for mask, letter in _CASTLING_LETTERS.items() if rights & mask)
+
+        ep = "-"
+        if self.en_passant_target is not None:
+            ep = square_name(*self.en_passant_target)
+
+        return "%s %s %s %s %d %d" % (
+            "/".join(ranks), self.turn, castling or "-", ep,
+            self.halfmove_clock, self.fullmove_number
+        )
 
     def get_pseudo_legal_moves(self):
         moves = []
@@ -24,7 +253,7 @@ class GameState:
                 for (r, c) in piece.get_moves(self.board, self):
                     moves.append((piece, r, c))
 
-                if isinstance(piece, King):
+                if piece.symbol == 'k':
                     self._add_castling_moves(piece, moves)
 
         return moves
@@ -38,7 +267,7 @@ class GameState:
 
         # King-side
         rook = self.board.grid[row][7]
-        if rook and isinstance(rook, Rook) and rook.color == king.color and not rook.has_moved:
+        if rook and rook.symbol == 'r' and rook.color == king.color and not rook.has_moved:
             if (self.board.grid[row][5] is None and
                 self.board.grid[row][6] is None):
                 if not self.is_square_attacked(row, 4, enemy) and \
@@ -48,7 +277,7 @@ class GameState:
 
         # Queen-side
         rook = self.board.grid[row][0]
-        if rook and isinstance(rook, Rook) and rook.color == king.color and not rook.has_moved:
+        if rook and rook.symbol == 'r' and rook.color == king.color and not rook.has_moved:
             if (self.board.grid[row][1] is None and
                 self.board.grid[row][2] is None and
                 self.board.grid[row][3] is None):
@@ -57,43 +286,87 @@ class GameState:
                 not self.is_square_attacked(row, 2, enemy):
                     moves.append((king, row, 2))
 
-    def make_move(self, piece, to_row, to_col):
+    def make_move(self, piece, to_row, to_col, promotion=None):
+        """
+        Play a move and push its UndoRecord onto move_history.
+
+        A pawn reaching the last rank leaves promotion_pending set until
+        promote_pawn is called, unless `promotion` ('q', 'r', 'b' or 'n')
+        is given, in which case it is promoted straight away.
+        """
+        board = self.board
         from_row, from_col = piece.row, piece.col
 
+        old_key = self.zobrist_key
+        old_score = self.eval_score
+        # Take the old castling rights and en-passant file out of the key
+        self.zobrist_key ^= CASTLING_KEYS[castling_rights(board)] ^ en_passant_key(self)
+
         old_ep = self.en_passant_target
+        self.en_passant_target = None
+
+        captured = board.grid[to_row][to_col]
+        rook = None
+        is_pawn = piece.symbol == 'p'
 
         # Detect two-square pawn move to create en-passant target
-        if piece.__class__.__name__ == "Pawn":
+        if is_pawn:
             if abs(to_row - from_row) == 2:
                 self.en_passant_target = ((from_row + to_row) // 2, from_col)
             # En passant capture
             if (to_row, to_col) == old_ep:
-                captured_row = from_row
-                captured_col = to_col
-                self.board.grid[captured_row][captured_col] = None
+                captured = board.remove_piece(from_row, to_col)
 
         # Detect castling
-        if piece.__class__.__name__ == "King":
+        if piece.symbol == 'k':
             if abs(to_col - from_col) == 2:  # castling attempt
-                self.castle_rook(piece, to_col)
+                rook = self.castle_rook(piece, to_col)
+
+        self.move_history.append(UndoRecord(
+            piece, from_row, from_col, to_row, to_col, captured,
+            piece.has_moved, rook, old_ep,
+            self.halfmove_clock, self.fullmove_number, old_key, old_score, None
+        ))
+
+        if is_pawn or captured is not None:
+            self.halfmove_clock = 0
+            self._repetition_stack.append(self.repetitions)
+            self.repetitions = {}
+        else:
+            self.halfmove_clock += 1
+
+        if captured is not None:
+            captured_sq = captured.row * 8 + captured.col
+            self.zobrist_key ^= PIECE_KEYS[captured.color][captured.symbol][captured_sq]
+            self.eval_score -= SQUARE_VALUES[captured.color][captured.symbol][captured_sq]
+        from_sq = from_row * 8 + from_col
+        to_sq = to_row * 8 + to_col
+        keys = PIECE_KEYS[piece.color][piece.symbol]
+        self.zobrist_key ^= keys[from_sq] ^ keys[to_sq]
+        values = SQUARE_VALUES[piece.color][piece.symbol]
+        self.eval_score += values[to_sq] - values[from_sq]
 
         # Move the piece normally
-        self.board.move_piece(piece, to_row, to_col)
+        board.move_piece(piece, to_row, to_col)
+        self.zobrist_key ^= CASTLING_KEYS[castling_rights(board)]
 
         # Promotion check
-        if piece.__class__.__name__ == "Pawn":
-            if (piece.color == 'w' and to_row == 0) or \
-            (piece.color == 'b' and to_row == 7):
-                self.promotion_pending = (piece, to_row, to_col)
-                return
+        if is_pawn and (to_row == 0 or to_row == 7):
+            self.promotion_pending = (piece, to_row, to_col)
+            if promotion:
+                self.promote_pawn(piece, promotion)
+            return
+
+        self._switch_turn()
 
-        # Update turn
+    def _switch_turn(self):
         self.turn = 'b' if self.turn == 'w' else 'w'
         if self.turn == 'w':
             self.fullmove_number += 1
 
-        if piece.__class__.__name__ != "Pawn" or abs(to_row - from_row) != 2:
-            self.en_passant_target = None
+        # The en-passant file only counts once we know who can capture
+        self.zobrist_key ^= SIDE_KEY ^ en_passant_key(self)
+        self.repetitions[self.zobrist_key] = self.repetitions.get(self.zobrist_key, 0) + 1
 
     def castle_rook(self, king, king_target_col):
         row = king.row
@@ -107,13 +380,18 @@ class GameState:
 
         rook = self.board.grid[row][rook_from]
         if rook:
+            keys = PIECE_KEYS[rook.color][rook.symbol]
+            self.zobrist_key ^= keys[row * 8 + rook_from] ^ keys[row * 8 + rook_to]
+            values = SQUARE_VALUES[rook.color][rook.symbol]
+            self.eval_score += values[row * 8 + rook_to] - values[row * 8 + rook_from]
             self.board.move_piece(rook, row, rook_to)
+        return rook
 
     def promote_pawn(self, pawn, piece_type):
         row, col = pawn.row, pawn.col
         color = pawn.color
 
-        self.board.grid[row][col] = None
+        self.board.remove_piece(row, col)
 
         if piece_type == 'q':
             new_piece = Queen(color, row, col)
@@ -124,92 +402,303 @@ class GameState:
         else:
             new_piece = Knight(color, row, col)
 
-        self.board.grid[row][col] = new_piece
+        new_piece.has_moved = True
+        self.board.place_piece(new_piece)
         self.promotion_pending = None
 
+        sq = row * 8 + col
+        self.zobrist_key ^= PIECE_KEYS[color]['p'][sq] ^ PIECE_KEYS[color][new_piece.symbol][sq]
+        self.eval_score += SQUARE_VALUES[color][new_piece.symbol][sq] - SQUARE_VALUES[color]['p'][sq]
+
+        if self.move_history and self.move_history[-1].piece is pawn:
+            self.move_history[-1] = self.move_history[-1]._replace(promoted=new_piece)
+
         # NOW switch turn
-        self.turn = 'b' if self.turn == 'w' else 'w'
+        self._switch_turn()
 
-    def get_legal_moves(self):
+    def unmake_move(self):
         """
-        Filter pseudo-legal moves by removing:
-        - moves that leave king in check
-        - illegal castling
-        - illegal en-passant (if king would be exposed)
+        Take back the last move from its UndoRecord.
+        Returns the record, or None if there is nothing to undo.
         """
-        legal_moves = []
+        if not self.move_history:
+            return None
+
+        record = self.move_history.pop()
+        board = self.board
+        piece = record.piece
+
+        # A move still waiting for its promotion piece was never counted
+        if self.promotion_pending is None:
+            # Keys at zero are dropped so the map holds only positions
+            # still on the game's path, not everything a search visited
+            count = self.repetitions[self.zobrist_key] - 1
+            if count:
+                self.repetitions[self.zobrist_key] = count
+            else:
+                del self.repetitions[self.zobrist_key]
+        if piece.symbol == 'p' or record.captured is not None:
+            self.repetitions = self._repetition_stack.pop()
+
+        # Lifts the moved piece, or the piece it was promoted to
+        board.remove_piece(record.to_row, record.to_col)
+        piece.row, piece.col = record.from_row, record.from_col
+        piece.has_moved = record.had_moved
+        board.place_piece(piece)
+
+        # A captured piece still knows its square, including en passant
+        if record.captured is not None:
+            board.place_piece(record.captured)
+
+        rook = record.rook
+        if rook is not None:
+            board.remove_piece(rook.row, rook.col)
+            rook.col = 7 if rook.col == 5 else 0
+            rook.has_moved = False
+            board.place_piece(rook)
+
+        self.turn = piece.color
+        self.en_passant_target = record.en_passant_target
+        self.halfmove_clock = record.halfmove_clock
+        self.fullmove_number = record.fullmove_number
+        self.zobrist_key = record.key
+        self.eval_score = record.score
+        self.promotion_pending = None
 
-        for (piece, r, c) in self.get_pseudo_legal_moves():
-            if self.is_legal(piece, r, c):
-                legal_moves.append((piece, r, c))
+        return record
 
-        return legal_moves
+    def _position_cache(self):
+        """
+        Cache for legal moves and status of the current position. It is
+        keyed on the Zobrist key and side to move, so make_move,
+        promote_pawn and unmake_move invalidate it implicitly, while a
+        make/unmake pair leaves it intact.
+        """
+        cache_id = (self.zobrist_key, self.turn)
+        if self._cache_id != cache_id:
+            self._cache_id = cache_id
+            self._cache = {}
+        return self._cache
 
-    def is_legal(self, piece, to_row, to_col):
+    def get_legal_moves(self):
         """
-        Make the move on a temporary board and check:
-        - does own king remain safe?
+        Legal moves for the side to move as (piece, row, col).
+        The list is cached per position and shared, so don't modify it.
         """
-        
-        # Save state
-        from_row, from_col = piece.row, piece.col
-        captured = self.board.grid[to_row][to_col]
+        moves = self._position_cache().get('moves')
+        if moves is None:
+            moves = self._generate_legal_moves()
+            # Generation may make and unmake moves, so fetch the cache again
+            self._position_cache()['moves'] = moves
+        return moves
 
-        ep_captured = None
+    def get_status(self):
+        """
+        'checkmate', 'stalemate', 'repetition', 'fifty_moves', 'check' or
+        None for the side to move. Checkmate wins over the draw rules.
+        The board part is cached per position, so the main loop can ask
+        for it every frame; the draw rules are dict and counter lookups.
+        """
+        status = self._board_status()
+        if status != 'checkmate':
+            if self.is_threefold_repetition():
+                return 'repetition'
+            if self.is_fifty_moves():
+                return 'fifty_moves'
+        return status
+
+    def is_threefold_repetition(self):
+        """
+        True once the current position has occurred three times.
+        """
+        return self.repetitions.get(self.zobrist_key, 0) >= 3
 
-        # Simulate en passant capture
-        if piece.__class__.__name__ == "Pawn":
-            if (to_row, to_col) == self.en_passant_target:
-                ep_row = from_row
-                ep_col = to_col
-                ep_captured = self.board.grid[ep_row][ep_col]
-                self.board.grid[ep_row][ep_col] = None
+    def is_fifty_moves(self):
+        """
+        True once fifty moves each have passed without a pawn move or capture.
+        """
+        return self.halfmove_clock >= 100
 
-        is_castling = (
-            piece.__class__.__name__ == "King" and
-            abs(to_col - from_col) == 2
-        )
+    def is_draw(self):
+        return self.get_status() in ('stalemate', 'repetition', 'fifty_moves')
 
-        # Save rook state if castling
-        rook = None
-        rook_from = rook_to = None
+    def _board_status(self):
+        # The draw rules depend on the move history, not just the position,
+        # so only this part can be cached under the position key
+        cache = self._position_cache()
+        if 'status' in cache:
+            return cache['status']
+
+        in_check = self.is_in_check(self.turn)
+        has_moves = len(self.get_legal_moves()) > 0
+
+        if in_check:
+            status = 'check' if has_moves else 'checkmate'
+        else:
+            status = None if has_moves else 'stalemate'
+
+        self._position_cache()['status'] = status
+        return status
+
+    def _generate_legal_moves(self):
+        """
+        Filter pseudo-legal moves by removing:
+        - moves that leave king in check
+        - illegal castling
+        - illegal en-passant (if king would be exposed)
 
-        if is_castling:
-            row = from_row
-            if to_col == 6:  # king-side
-                rook_from, rook_to = 7, 5
-            else:            # queen-side
-                rook_from, rook_to = 0, 3
+        Checkers and pinned pieces are found once per position, so most
+        moves are accepted with set lookups. King moves are tested with
+        the king lifted off the board, and only en passant, which clears
+        two squares on one rank, still goes through is_legal.
+        """
+        color = self.turn
+        king_pos = self.find_king(color)
+        if king_pos is None:
+            return [(p, r, c) for (p, r, c) in self.get_pseudo_legal_moves()
+                    if self.is_legal(p, r, c)]
 
-            rook = self.board.grid[row][rook_from]
-            self.board.grid[row][rook_from] = None
-            self.board.grid[row][rook_to] = rook
-            rook.col = rook_to
+        enemy = 'b' if color == 'w' else 'w'
+        checkers, block_squares, pins = self._checks_and_pins(king_pos, color)
+        king_row, king_col = king_pos
+        ep_target = self.en_passant_target
 
+        legal_moves = []
+        king_moves = []
+
+        for move in self.get_pseudo_legal_moves():
+            piece, r, c = move
+
+            if piece.row == king_row and piece.col == king_col:
+                if abs(c - king_col) == 2:
+                    # _add_castling_moves already checked every square
+                    legal_moves.append(move)
+                else:
+                    king_moves.append(move)
+                continue
+
+            if checkers > 1:
+                continue
+
+            if (r, c) == ep_target and piece.symbol == 'p':
+                if self.is_legal(piece, r, c):
+                    legal_moves.append(move)
+                continue
+
+            pin = pins.get(piece)
+            if pin is not None and (r, c) not in pin:
+                continue
+            if checkers and (r, c) not in block_squares:
+                continue
+
+            legal_moves.append(move)
+
+        if king_moves:
+            # Lift the king so sliders see through its current square
+            board = self.board
+            king = board.remove_piece(king_row, king_col)
+            for move in king_moves:
+                if not self.is_square_attacked(move[1], move[2], enemy):
+                    legal_moves.append(move)
+            board.place_piece(king)
 
-        # Make move
-        self.board.grid[from_row][from_col] = None
-        self.board.grid[to_row][to_col] = piece
-        piece.row, piece.col = to_row, to_col
+        return legal_moves
 
-        # Check if in check
-        in_check = self.is_in_check(piece.color)
+    def _checks_and_pins(self, king_pos, color):
+        """
+        Returns (number of checkers, squares that resolve a single check,
+        {pinned piece: squares it may still move to}) for `color`'s king.
+        """
+        grid = self.board.grid
+        king_row, king_col = king_pos
+        enemy = 'b' if color == 'w' else 'w'
+
+        checkers = 0
+        block_squares = set()
+        pins = {}
+
+        sq = king_row * 8 + king_col
+
+        # Pawn checks
+        for square in PAWN_CAPTURES[color][sq]:
+            attacker = grid[square[0]][square[1]]
+            if attacker is not None and attacker.color == enemy and attacker.symbol == 'p':
+                checkers += 1
+                block_squares.add(square)
+
+        # Knight checks
+        for square in KNIGHT_TARGETS[sq]:
+            attacker = grid[square[0]][square[1]]
+            if attacker is not None and attacker.color == enemy and attacker.symbol == 'n':
+                checkers += 1
+                block_squares.add(square)
+
+        # Slider checks and pins along the 8 rays from the king
+        for rays, slider in ((BISHOP_RAYS[sq], 'b'), (ROOK_RAYS[sq], 'r')):
+            for ray in rays:
+                blocker = None
+                for i, (r, c) in enumerate(ray):
+                    target = grid[r][c]
+                    if target is None:
+                        continue
+                    if target.color == color:
+                        if blocker is not None:
+                            break
+                        blocker = target
+                    else:
+                        if target.symbol == slider or target.symbol == 'q':
+                            if blocker is None:
+                                checkers += 1
+                                block_squares.update(ray[:i + 1])
+                            else:
+                                pins[blocker] = set(ray[:i + 1])
+                        break
+
+        return checkers, block_squares, pins
+
+    def move_from_code(self, code):
+        """
+        Turn an encode_move() code back into a (piece, row, col, promotion)
+        move for this position, or None if it is not legal here.
+        """
+        from_row, from_col, to_row, to_col, promotion = decode_move(code)
+        piece = self.board.grid[from_row][from_col]
+        if piece is None:
+            return None
+        for (p, r, c) in self.get_legal_moves():
+            if p is piece and r == to_row and c == to_col:
+                if (piece.symbol == 'p' and (r == 0 or r == 7)) != (promotion is not None):
+                    return None
+                return (piece, r, c, promotion)
+        return None
 
-        # Undo move
-        self.board.grid[from_row][from_col] = piece
-        self.board.grid[to_row][to_col] = captured
-        piece.row, piece.col = from_row, from_col
+    def get_legal_moves_with_promotions(self):
+        """
+        Legal moves as (piece, row, col, promotion) with one entry per
+        promotion piece, for callers that play moves without the UI.
+        """
+        moves = []
+        for (piece, r, c) in self.get_legal_moves():
+            if piece.symbol == 'p' and (r == 0 or r == 7):
+                for promotion in PROMOTION_PIECES:
+                    moves.append((piece, r, c, promotion))
+            else:
+                moves.append((piece, r, c, None))
+        return moves
 
-        # Undo en passant
-        if ep_captured:
-            self.board.grid[ep_row][ep_col] = ep_captured
+    def is_legal(self, piece, to_row, to_col):
+        """
+        Play the move, check whether the own king is safe,
+        then take it back with unmake_move.
+        """
+        color = piece.color
+        pending = self.promotion_pending
 
-        # Undo castling
-        if is_castling:
-            self.board.grid[row][rook_to] = None
-            self.board.grid[row][rook_from] = rook
-            rook.col = rook_from
+        self.make_move(piece, to_row, to_col)
+        in_check = self.is_in_check(color)
+        self.unmake_move()
 
+        self.promotion_pending = pending
         return not in_check
 
     def is_square_attacked(self, row, col, by_color):
@@ -217,71 +706,48 @@ class GameState:
         Returns True if the square (row,col) is attacked by `by_color`.
         """
         board = self.board.grid
+        sq = row * 8 + col
 
         # ---------- Pawn attacks ----------
-        dr = 1 if by_color == 'w' else -1
-        for dc in (-1, 1):
-            r = row + dr
-            c = col + dc
-            if 0 <= r < 8 and 0 <= c < 8:
-                attacker = board[r][c]
-                if attacker and attacker.color == by_color and attacker.__class__.__name__ == "Pawn":
-                    return True
+        # Attacking pawns stand where a pawn of the other color on this
+        # square would capture
+        for r, c in PAWN_CAPTURES['b' if by_color == 'w' else 'w'][sq]:
+            attacker = board[r][c]
+            if attacker is not None and attacker.color == by_color and attacker.symbol == 'p':
+                return True
 
-        
         # ---------- Knight attacks ----------
-        knight_moves = [(-2, 1), (-1, 2), (1, 2), (2, 1),
-                        (-2, -1), (-1, -2), (1, -2), (2, -1)]
-        
-        for dr, dc in knight_moves:
-            r = row + dr
-            c = col + dc
-            if 0 <= r < 8 and 0 <= c < 8:
-                attacker = board[r][c]
-                if attacker is not None and attacker.color == by_color:
-                    if attacker.__class__.__name__ == "Knight":
-                        return True
-        
-        # ---------- King attacks ----------
-        for dr in (-1, 0, 1):
-            for dc in (-1, 0, 1):
-                if dr == 0 and dc == 0:
-                    continue
+        for r, c in KNIGHT_TARGETS[sq]:
+            attacker = board[r][c]
+            if attacker is not None and attacker.color == by_color:
+                if attacker.symbol == 'n':
+                    return True
 
-                r = row + dr
-                c = col + dc
-                if 0 <= r < 8 and 0 <= c < 8:
-                    attacker = board[r][c]
-                    if attacker is not None and attacker.color == by_color:
-                        if attacker.__class__.__name__ == "King":
-                            return True
+        # ---------- King attacks ----------
+        for r, c in KING_TARGETS[sq]:
+            attacker = board[r][c]
+            if attacker is not None and attacker.color == by_color:
+                if attacker.symbol == 'k':
+                    return True
 
         # ---------- Sliding pieces ----------
         # Diagonals (Bishop / Queen)
-        diag_dirs = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-        for dr, dc in diag_dirs:
-            r, c = row + dr, col + dc
-            while 0 <= r < 8 and 0 <= c < 8:
+        for ray in BISHOP_RAYS[sq]:
+            for r, c in ray:
                 attacker = board[r][c]
                 if attacker is not None:
-                    if attacker.color == by_color and attacker.__class__.__name__ in ("Bishop","Queen"):
+                    if attacker.color == by_color and attacker.symbol in ('b', 'q'):
                         return True
                     break
-                r += dr
-                c += dc
 
         # Straight (Rook / Queen)
-        straight_dirs = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-        for dr, dc in straight_dirs:
-            r, c = row + dr, col + dc
-            while 0 <= r < 8 and 0 <= c < 8:
+        for ray in ROOK_RAYS[sq]:
+            for r, c in ray:
                 attacker = board[r][c]
                 if attacker is not None:
-                    if attacker.color == by_color and attacker.__class__.__name__ in ("Rook","Queen"):
+                    if attacker.color == by_color and attacker.symbol in ('r', 'q'):
                         return True
                     break
-                r += dr
-                c += dc
 
         return False
 
@@ -289,11 +755,20 @@ class GameState:
         for r in range(8):
             for c in range(8):
                 piece = self.board.grid[r][c]
-                if piece and piece.color == color and piece.__class__.__name__ == "King":
+                if piece and piece.color == color and piece.symbol == 'k':
                     return (r, c)
         return None
 
     def is_in_check(self, color):
+        if color == self.turn:
+            cache = self._position_cache()
+            if 'in_check' not in cache:
+                cache['in_check'] = self._king_attacked(color)
+            return cache['in_check']
+
+        return self._king_attacked(color)
+
+    def _king_attacked(self, color):
         king_pos = self.find_king(color)
         if king_pos is None:
             return False  # should never happen, but keeps things safe
@@ -305,6 +780,9 @@ class GameState:
         return self.is_in_check(self.turn)
 
     def is_checkmate(self, color):
+        if color == self.turn:
+            return self._board_status() == 'checkmate'
+
         # Condition 1: king must be in check
         if not self.is_in_check(color):
             return False
@@ -320,6 +798,9 @@ class GameState:
         return len(legal_moves) == 0
 
     def is_stalemate(self, color):
+        if color == self.turn:
+            return self._board_status() == 'stalemate'
+
         # Not in check
         if self.is_in_check(color):
             return False
@@ -337,4 +818,4 @@ class GameState:
         """
         Undo the last move.
         """
-        pass
+        return self.unmake_move()
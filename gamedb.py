@@ -0,0 +1,480 @@
+# Compact binary game database, read through mmap.
+#
+# One file holds, in order:
+#
+#   header     HEADER, with the size and offset of every section
+#   moves      uint16 encode_move() codes of all games, back to back
+#   games      one GAME_RECORD per game: first move, ply count, result,
+#              and its entry in `starts` if it has a non-standard start
+#   starts     POSITION_RECORDs for the non-standard starting positions
+#   positions  optional, one POSITION_RECORD per position of every game
+#   hash       optional, open-addressing (zobrist key, position) slots
+#
+# Positions are numbered in file order: game g has plies + 1 of them,
+# starting at first_move + g. Every record has a fixed width, so finding
+# game N, its moves or (with positions stored) the board at ply K is an
+# offset computation, with nothing parsed on the way. Integers are in
+# native byte order.
+
+import argparse
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from collections import namedtuple
+
+from board import Board
+from game import GameState, encode_move, decode_move
+from notation import FILES, square_name, parse_square
+from zobrist import castling_rights
+
+MAGIC = b"CGDB"
+VERSION = 1
+
+# Header flags
+HAS_POSITIONS = 1
+HAS_HASH = 2
+
+# magic, version, flags, games, moves, starts, positions, then the
+# offsets of the moves, games, starts, positions and hash sections and
+# the number of hash slots
+HEADER = struct.Struct("<4sHHQQQQQQQQQQ")
+HEADER_SIZE = 128
+
+# first move, plies, result, flags (unused), start (NO_START if standard)
+GAME_RECORD = struct.Struct("<QHBBI")
+NO_START = 0xFFFFFFFF
+
+# 64 squares at 4 bits each (PIECE_CODES), side to move and castling
+# rights, en-passant file + 1 (0 for none), halfmove clock, fullmove number
+POSITION_RECORD = struct.Struct("<32sBBHH2x")
+
+HASH_SLOT = struct.Struct("<QQ")
+
+RESULTS = ("*", "1-0", "0-1", "1/2-1/2")
+_RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+
+_COPY_BYTES = 1 << 20
+
+GameRecord = namedtuple("GameRecord", ["first_move", "plies", "result", "start"])
+
+
+def pack_position(state):
+    """
+    The POSITION_RECORD bytes of a GameState.
+    """
+    codes = state.board.encode()
+    squares = bytes(codes[i] << 4 | codes[i + 1] for i in range(0, 64, 2))
+    flags = (state.turn == 'b') | castling_rights(state.board) << 1
+    ep = state.en_passant_target
+    return POSITION_RECORD.pack(squares, flags, 0 if ep is None else ep[1] + 1,
+                                state.halfmove_clock, state.fullmove_number)
+
+
+def unpack_position(data, offset=0):
+    """
+    A GameState from the POSITION_RECORD at `offset` in `data`.
+    """
+    squares, flags, ep, halfmove_clock, fullmove_number = POSITION_RECORD.unpack_from(data, offset)
+    codes = bytearray(64)
+    for i, byte in enumerate(squares):
+        codes[2 * i] = byte >> 4
+        codes[2 * i + 1] = byte & 15
+
+    turn = 'b' if flags & 1 else 'w'
+    en_passant_target = None
+    if ep:
+        en_passant_target = (2 if turn == 'w' else 5, ep - 1)
+    return GameState.from_board(Board.decode(codes), turn, flags >> 1,
+                                en_passant_target, halfmove_clock, fullmove_number)
+
+
+def code_to_uci(code):
+    from_row, from_col, to_row, to_col, promotion = decode_move(code)
+    return square_name(from_row, from_col) + square_name(to_row, to_col) + (promotion or "")
+
+
+def uci_to_code(uci):
+    """
+    Move code of a UCI move such as 'e7e8q'. Raises ValueError if it is
+    malformed; whether it is legal is not checked here.
+    """
+    if (len(uci) not in (4, 5) or uci[0] not in FILES or uci[2] not in FILES or
+            uci[1] not in "12345678" or uci[3] not in "12345678" or uci[4:] not in ("", "q", "r", "b", "n")):
+        raise ValueError("bad UCI move: %r" % (uci,))
+    from_row, from_col = parse_square(uci[0:2])
+    to_row, to_col = parse_square(uci[2:4])
+    return encode_move(from_row, from_col, to_row, to_col, uci[4:5] or None)
+
+
+def _hash_slots(count):
+    # At most half full, and a power of two so the key can be masked
+    slots = 1
+    while slots < 2 * count:
+        slots *= 2
+    return slots
+
+
+class GameDBWriter:
+    """
+    Streams games into a new database file. Moves go straight to the
+    file and the other sections to temporary files, so memory use does
+    not grow with the number of games. close() writes the index.
+    """
+
+    def __init__(self, path, positions=False, hash_index=False):
+        self.path = path
+        self.store_positions = positions
+        self.hash_index = hash_index
+
+        self.out = open(path, "w+b")
+        self.out.write(bytes(HEADER_SIZE))
+        self.games_file = tempfile.TemporaryFile()
+        self.positions_file = tempfile.TemporaryFile() if positions else None
+        self.keys_file = tempfile.TemporaryFile() if hash_index else None
+        self.starts_file = tempfile.TemporaryFile()
+        self.starts = 0
+
+        self.games = 0
+        self.moves = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # A write that failed part way must not end up as a valid file
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add_game(self, moves, result="*", fen=None):
+        """
+        Append a game given as UCI moves, from `fen` or the standard start.
+        The game is replayed and every move checked against the rules, so
+        GameDB can always replay what it reads. Nothing is written for a
+        game that raises ValueError.
+        """
+        if len(moves) > 0xFFFF:
+            raise ValueError("game too long to store: %d plies" % len(moves))
+        codes = array('H', map(uci_to_code, moves))
+
+        state = GameState.from_fen(fen) if fen is not None else None
+
+        # Replay the whole game before any of it reaches the files, so a
+        # rejected game cannot shift the positions of the ones after it
+        positions = []
+        keys = []
+        replay = GameState.from_fen(fen) if fen is not None else GameState()
+        self._collect_position(replay, positions, keys)
+        for code in codes:
+            move = replay.move_from_code(code)
+            if move is None:
+                raise ValueError("illegal move %s in game %d" % (code_to_uci(code), self.games))
+            replay.make_move(*move)
+            self._collect_position(replay, positions, keys)
+
+        start = NO_START
+        if state is not None:
+            start = self.starts
+            self.starts_file.write(pack_position(state))
+            self.starts += 1
+        if positions:
+            self.positions_file.write(b"".join(positions))
+        if keys:
+            self.keys_file.write(b"".join(keys))
+
+        self.games_file.write(GAME_RECORD.pack(self.moves, len(codes), _RESULT_CODES.get(result, 0), 0, start))
+        codes.tofile(self.out)
+        self.games += 1
+        self.moves += len(codes)
+
+    def _collect_position(self, state, positions, keys):
+        if self.store_positions:
+            positions.append(pack_position(state))
+        if self.hash_index:
+            keys.append(state.zobrist_key.to_bytes(8, sys.byteorder))
+
+    def abort(self):
+        """
+        Drop everything written so far and delete the output file.
+        """
+        if self.out is None:
+            return
+        self.out.close()
+        self.out = None
+        for temp in (self.games_file, self.positions_file, self.keys_file, self.starts_file):
+            if temp is not None:
+                temp.close()
+        os.remove(self.path)
+
+    def close(self):
+        if self.out is None:
+            return
+        out = self.out
+        self.out = None
+
+        positions = self.moves + self.games
+        flags = 0
+        moves_offset = HEADER_SIZE
+
+        # Align the later sections for 64-bit memoryview casts
+        out.write(bytes(-out.tell() % 8))
+
+        games_offset = out.tell()
+        self._copy(self.games_file, out)
+
+        starts_offset = out.tell()
+        self._copy(self.starts_file, out)
+
+        positions_offset = out.tell()
+        if self.positions_file is not None:
+            flags |= HAS_POSITIONS
+            self._copy(self.positions_file, out)
+
+        hash_offset = out.tell()
+        slots = 0
+        if self.keys_file is not None:
+            flags |= HAS_HASH
+            slots = _hash_slots(positions)
+            out.truncate(hash_offset + slots * HASH_SLOT.size)
+            out.flush()
+            self._fill_hash(out, hash_offset, slots)
+            self.keys_file.close()
+
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, VERSION, flags, self.games, self.moves, self.starts, positions,
+                              moves_offset, games_offset, starts_offset, positions_offset, hash_offset, slots))
+        out.close()
+
+    def _copy(self, temp, out):
+        temp.seek(0)
+        shutil.copyfileobj(temp, out, _COPY_BYTES)
+        temp.close()
+
+    def _fill_hash(self, out, offset, slots):
+        # Linear probing; slot values are position number + 1 so 0 is empty
+        with mmap.mmap(out.fileno(), 0) as mm:
+            words = memoryview(mm)[offset:offset + slots * HASH_SLOT.size].cast('Q')
+            mask = slots - 1
+            number = 0
+            self.keys_file.seek(0)
+            while True:
+                keys = array('Q')
+                keys.frombytes(self.keys_file.read(_COPY_BYTES))
+                if not keys:
+                    break
+                for key in keys:
+                    i = key & mask
+                    while words[2 * i + 1]:
+                        i = (i + 1) & mask
+                    words[2 * i] = key
+                    words[2 * i + 1] = number + 1
+                    number += 1
+            words.release()
+
+
+class GameDB:
+    """
+    Read-only view of a database file. Games are numbered from 0.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.flags, self.games, self.total_moves, starts, self.positions,
+         moves_offset, self.games_offset, self.starts_offset, self.positions_offset,
+         hash_offset, self.hash_slots) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            self.file.close()
+            raise ValueError("%s is not a version %d game database" % (path, VERSION))
+
+        view = memoryview(self.mm)
+        self.codes = view[moves_offset:moves_offset + 2 * self.total_moves].cast('H')
+        self.hash = None
+        if self.flags & HAS_HASH:
+            self.hash = view[hash_offset:hash_offset + self.hash_slots * HASH_SLOT.size].cast('Q')
+        view.release()
+
+    def close(self):
+        """
+        Views returned by moves() must be released or dropped first.
+        """
+        if self.mm is None:
+            return
+        self.codes.release()
+        if self.hash is not None:
+            self.hash.release()
+        self.codes = self.hash = None
+        self.mm.close()
+        self.file.close()
+        self.mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.games
+
+    @property
+    def has_positions(self):
+        return bool(self.flags & HAS_POSITIONS)
+
+    def game(self, n):
+        if not 0 <= n < self.games:
+            raise IndexError("game %d out of range" % n)
+        first_move, plies, result, _, start = GAME_RECORD.unpack_from(
+            self.mm, self.games_offset + n * GAME_RECORD.size)
+        return GameRecord(first_move, plies, RESULTS[result], start)
+
+    def moves(self, n):
+        """
+        The encode_move() codes of game `n`, as a zero-copy memoryview.
+        """
+        record = self.game(n)
+        return self.codes[record.first_move:record.first_move + record.plies]
+
+    def uci_moves(self, n):
+        return [code_to_uci(code) for code in self.moves(n)]
+
+    def start_position(self, n):
+        record = self.game(n)
+        if record.start == NO_START:
+            return GameState()
+        return unpack_position(self.mm, self.starts_offset + record.start * POSITION_RECORD.size)
+
+    def position(self, n, ply):
+        """
+        The GameState of game `n` after `ply` moves. Read directly when
+        positions are stored, otherwise replayed from the start.
+        """
+        record = self.game(n)
+        if not 0 <= ply <= record.plies:
+            raise IndexError("ply %d out of range for game %d" % (ply, n))
+
+        if self.has_positions:
+            number = record.first_move + n + ply
+            return unpack_position(self.mm, self.positions_offset + number * POSITION_RECORD.size)
+
+        state = self.start_position(n)
+        for code in self.codes[record.first_move:record.first_move + ply]:
+            state.make_move(*state.move_from_code(code))
+        return state
+
+    def find(self, key):
+        """
+        (game, ply) of every stored position with Zobrist key `key`
+        (a GameState or its zobrist_key), in file order.
+        """
+        if self.hash is None:
+            raise ValueError("database has no position hash index")
+        if isinstance(key, GameState):
+            key = key.zobrist_key
+
+        words = self.hash
+        mask = self.hash_slots - 1
+        numbers = []
+        i = key & mask
+        while words[2 * i + 1]:
+            if words[2 * i] == key:
+                numbers.append(words[2 * i + 1] - 1)
+            i = (i + 1) & mask
+
+        return [self._locate(number) for number in sorted(numbers)]
+
+    def _locate(self, number):
+        # Binary search for the game whose positions include `number`
+        lo, hi = 0, self.games - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.game(mid).first_move + mid <= number:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo, number - self.game(lo).first_move - lo
+
+
+def read_source(path):
+    """
+    (uci moves, result, fen) for each game of a PGN file, a self-play
+    JSONL file or a game database. `fen` is None for standard starts.
+    """
+    if path.endswith(".db"):
+        with GameDB(path) as db:
+            for n in range(len(db)):
+                record = db.game(n)
+                fen = None if record.start == NO_START else db.start_position(n).to_fen()
+                yield db.uci_moves(n), record.result, fen
+        return
+
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                yield record["moves"], record["result"], record.get("fen")
+        return
+
+    from pgn import iter_games
+    with open(path, "rb") as f:
+        for headers, moves in iter_games(f, skip_invalid=True):
+            yield moves, headers.get("Result", "*"), headers.get("FEN")
+
+
+def build(source, out_path, positions=False, hash_index=False):
+    """
+    Write the games of a PGN or self-play JSONL file to a database.
+    Returns the number of games.
+    """
+    with GameDBWriter(out_path, positions, hash_index) as writer:
+        for moves, result, fen in read_source(source):
+            writer.add_game(moves, result, fen)
+        return writer.games
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect a binary game database")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="convert a .pgn or self-play .jsonl file")
+    build_parser.add_argument("source")
+    build_parser.add_argument("out")
+    build_parser.add_argument("--positions", action="store_true", help="store every position")
+    build_parser.add_argument("--hash", action="store_true", help="add a position hash index")
+
+    info_parser = sub.add_parser("info", help="summarize a database, or print one game")
+    info_parser.add_argument("path")
+    info_parser.add_argument("--game", type=int)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        games = build(args.source, args.out, args.positions, args.hash)
+        elapsed = time.perf_counter() - start
+        print("%d games -> %s (%d bytes) in %.1fs" % (
+            games, args.out, os.path.getsize(args.out), elapsed))
+        return 0
+
+    with GameDB(args.path) as db:
+        if args.game is None:
+            print("%d games, %d moves, positions %s, hash index %s" % (
+                len(db), db.total_moves, "yes" if db.has_positions else "no",
+                "yes" if db.hash is not None else "no"))
+        else:
+            record = db.game(args.game)
+            print("%s %s" % (record.result, " ".join(db.uci_moves(args.game))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,14 @@
 import pygame
 from game import GameState
 import game
+import profiling
 from renderer import Renderer
 
+# Upper bound on frames per second. In event-driven mode the loop sleeps
+# until input arrives and this only caps bursts; with event_driven=False
+# the loop polls at this rate, for animations or a background search.
+FRAME_CAP = 60
+
 def mouse_to_square(pos, renderer):
     x, y = pos
     col = (x - renderer.board_x) // renderer.square_size
@@ -12,25 +18,51 @@ def mouse_to_square(pos, renderer):
         return row, col
     return None
 
-def main():
+def frame_text():
+    # Times of the frames before this one; this frame is still being drawn
+    summary = profiling.frame_summary()
+    if summary is None:
+        return "frame -"
+    last, mean, p95, worst = summary
+    return "frame %.1f ms  mean %.1f  p95 %.1f  max %.1f" % (last, mean, p95, worst)
+
+def main(event_driven=True, frame_cap=FRAME_CAP):
     game_over = False
     selected_piece = None
     legal_targets = []
     last_move_square = None
 
+    # CHESS_PROFILE=report.json times the hot paths and shows frame times
+    profiling.enable_from_env()
+
     pygame.init()
     window = pygame.display.set_mode((576, 640))
 
     game = GameState()
     renderer = Renderer(window, game.board)
+    clock = pygame.time.Clock()
+    needs_redraw = True
     
     running = True
     while running:
-        for event in pygame.event.get():
+        if event_driven and not needs_redraw:
+            # Nothing changed since the last frame: block until input arrives
+            events = [pygame.event.wait()]
+            events.extend(pygame.event.get())
+        else:
+            events = pygame.event.get()
+
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
 
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.invalidate()
+                needs_redraw = True
+
             if event.type == pygame.MOUSEBUTTONDOWN:
+                needs_redraw = True
+
                 if game.promotion_pending:
                     choice = renderer.handle_promotion_click(event.pos)
                     if choice:
@@ -77,7 +109,7 @@ def main():
                     if (row, col) in legal_targets:
                         game.make_move(selected_piece, row, col)
 
-                    if game.is_checkmate(game.turn) or game.is_stalemate(game.turn):
+                    if game.get_status() in ('checkmate', 'stalemate', 'repetition', 'fifty_moves'):
                         game_over = True
 
                         last_move_square = (row, col)
@@ -95,15 +127,32 @@ def main():
                         selected_piece = None
                         legal_targets = []
         
+        if not running:
+            break
+
+        if event_driven and not needs_redraw:
+            continue
+        needs_redraw = False
+        profiling.frame_begin()
+
+        # Cached per position, so this is cheap on frames where nothing moved
+        status = game.get_status()
+
         status_text = ""
-        if game.is_checkmate(game.turn):
+        if status == 'checkmate':
             winner = "White" if game.turn == 'b' else "Black"
             status_text = f"Checkmate! {winner} wins"
 
-        elif game.is_stalemate(game.turn):
+        elif status == 'stalemate':
             status_text = "Stalemate"
 
-        elif game.is_in_check(game.turn):
+        elif status == 'repetition':
+            status_text = "Draw by threefold repetition"
+
+        elif status == 'fifty_moves':
+            status_text = "Draw by the fifty-move rule"
+
+        elif status == 'check':
             side = "White" if game.turn == 'w' else "Black"
             status_text = f"{side} is in check"
 
@@ -111,33 +160,52 @@ def main():
             side = "White" if game.turn == 'w' else "Black"
             status_text = f"{side} to move"
 
-        renderer.draw_board()
+        king_square = None
+        if status in ('check', 'checkmate'):
+            king_square = game.find_king(game.turn)
 
-        if legal_targets:
-            renderer.highlight_moves(legal_targets)
+        if game_over or game.promotion_pending:
+            # Overlays cover the whole board, so these frames are drawn in full
+            renderer.draw_board()
 
-        if last_move_square:
-            r, c = last_move_square
-            renderer.highlight_square(r, c)
+            if legal_targets:
+                renderer.highlight_moves(legal_targets)
 
-        if game.is_in_check(game.turn):
-            king_pos = game.find_king(game.turn)
-            if king_pos:
-                renderer.highlight_square(king_pos[0], king_pos[1], color=(255, 0, 0))
+            if last_move_square:
+                r, c = last_move_square
+                renderer.highlight_square(r, c)
 
-        renderer.draw_pieces()
-        renderer.draw_status_bar(status_text)
+            if king_square:
+                renderer.highlight_square(king_square[0], king_square[1], color=(255, 0, 0))
 
-        if game_over:
-            renderer.dim_board()
-            renderer.draw_restart_prompt()
+            renderer.draw_pieces()
+            renderer.draw_status_bar(status_text)
 
-        if game.promotion_pending:
-            pawn, _, _ = game.promotion_pending
-            renderer.dim_board()
-            renderer.draw_promotion_menu(pawn.color)
+            if game_over:
+                renderer.dim_board()
+                renderer.draw_restart_prompt()
 
-        pygame.display.flip()
+            if game.promotion_pending:
+                pawn, _, _ = game.promotion_pending
+                renderer.dim_board()
+                renderer.draw_promotion_menu(pawn.color)
+
+            if profiling.enabled:
+                renderer.draw_overlay(frame_text())
+
+            pygame.display.flip()
+            renderer.invalidate()
+
+        else:
+            # Only squares and status text that changed since the last frame
+            dirty = renderer.draw_frame(status_text, legal_targets, last_move_square, king_square)
+            if profiling.enabled:
+                dirty.append(renderer.draw_overlay(frame_text()))
+            if dirty:
+                pygame.display.update(dirty)
+
+        profiling.frame_end()
+        clock.tick(frame_cap)
 
     pygame.quit()
 
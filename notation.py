@@ -0,0 +1,21 @@
+# Square and move notation helpers.
+
+FILES = "abcdefgh"
+
+
+def square_name(row, col):
+    return FILES[col] + str(8 - row)
+
+
+def parse_square(name):
+    """
+    'e4' -> (4, 4)
+    """
+    return 8 - int(name[1]), FILES.index(name[0])
+
+
+def move_to_uci(piece, to_row, to_col, promotion=None):
+    """
+    Long algebraic (UCI) name of a move, e.g. 'e2e4' or 'e7e8q'.
+    """
+    return square_name(piece.row, piece.col) + square_name(to_row, to_col) + (promotion or "")
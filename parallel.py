@@ -0,0 +1,240 @@
+# Multi-process search by root-move splitting.
+#
+# Each iteration of the iterative deepening loop first searches the
+# expected best root move with a full window. Every other root move then
+# goes to a worker process with a null window around that score, and the
+# moves that fail high are searched again with an open window. Workers
+# use their own Searcher and transposition table, and the coordinator
+# breaks ties by root move order, so the result never depends on which
+# worker finishes first.
+
+import argparse
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from game import GameState, encode_move
+from notation import move_to_uci
+from search import Searcher, SearchResult, MATE_THRESHOLD, DEFAULT_DEPTH, MAX_DEPTH, INFINITY
+from tt import TranspositionTable
+
+# Per-process table, created once by the pool initializer
+_worker_tt = None
+
+
+def _init_worker(tt_size_mb):
+    global _worker_tt
+    _worker_tt = TranspositionTable(tt_size_mb)
+
+
+def _search_root_move(state_bytes, code, depth, deadline, window):
+    """
+    Worker task: search one root move to `depth` within `window`.
+    Returns (score, nodes, completed); completed is False only when the
+    deadline cut the search short.
+    """
+    state = pickle.loads(state_bytes)
+    move = state.move_from_code(code)
+
+    # A fresh table per task keeps results independent of scheduling
+    _worker_tt.clear()
+
+    time_limit = None
+    if deadline is not None:
+        time_limit = deadline - time.time()
+        if time_limit <= 0:
+            return 0, 0, False
+
+    searcher = Searcher(state, max_depth=depth, time_limit=time_limit,
+                        tt=_worker_tt, root_moves=[move], root_window=window)
+    result = searcher.search()
+    # Searcher ends iterative deepening early once it sees a mate score,
+    # which still gives a usable result; only running out of time does not
+    return result.score, result.nodes, not searcher.stopped
+
+
+class ParallelSearcher:
+    """
+    Spreads the search of one position over `workers` processes.
+    The pool is kept between searches; call close() when done.
+    """
+
+    def __init__(self, workers=None, tt_size_mb=4):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(tt_size_mb,),
+        )
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self, state_bytes, codes, depth, deadline, window):
+        """
+        Search `codes` in parallel. Returns ({code: score}, nodes), or
+        None if the deadline passed before every move finished.
+        """
+        futures = {
+            self.pool.submit(_search_root_move, state_bytes, code, depth, deadline, window): code
+            for code in codes
+        }
+        scores = {}
+        nodes = 0
+
+        pending = set(futures)
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+
+            out_of_time = False
+            for future in done:
+                score, task_nodes, finished = future.result()
+                nodes += task_nodes
+                if finished:
+                    scores[futures[future]] = score
+                else:
+                    out_of_time = True
+            if out_of_time:
+                break
+
+        if len(scores) < len(codes):
+            for future in pending:
+                future.cancel()
+            return None
+        return scores, nodes
+
+    def search(self, state, max_depth=None, time_limit=None, info=None):
+        """
+        Same limits and result as Searcher.search, except node limits.
+        """
+        if max_depth is None:
+            max_depth = DEFAULT_DEPTH if time_limit is None else MAX_DEPTH
+
+        start = time.perf_counter()
+        deadline = time.time() + time_limit if time_limit is not None else None
+
+        root_moves = state.get_legal_moves_with_promotions()
+        if len(root_moves) < 2:
+            # Nothing to split
+            return Searcher(state, max_depth=max_depth, time_limit=time_limit).search()
+
+        codes = [encode_move(p.row, p.col, r, c, promotion) for (p, r, c, promotion) in root_moves]
+        moves_by_code = dict(zip(codes, root_moves))
+        state_bytes = pickle.dumps(state)
+
+        best = SearchResult(root_moves[0], 0, 0, 0, 0.0)
+        total_nodes = 0
+
+        for depth in range(1, max_depth + 1):
+            # The expected best move sets the bound for the others
+            first = self._run(state_bytes, codes[:1], depth, deadline, (-INFINITY, INFINITY))
+            if first is None:
+                break
+            scores, nodes = first
+            total_nodes += nodes
+            bound = scores[codes[0]]
+
+            rest = self._run(state_bytes, codes[1:], depth, deadline, (bound, bound + 1))
+            if rest is None:
+                break
+            rest_scores, nodes = rest
+            total_nodes += nodes
+
+            fail_high = [code for code in codes[1:] if rest_scores[code] > bound]
+            if fail_high:
+                research = self._run(state_bytes, fail_high, depth, deadline, (bound, INFINITY))
+                if research is None:
+                    break
+                research_scores, nodes = research
+                total_nodes += nodes
+                rest_scores.update(research_scores)
+            scores.update(rest_scores)
+
+            # Highest score wins; ties go to the earlier move in `codes`
+            best_code = max(codes, key=lambda code: (scores[code], -codes.index(code)))
+            elapsed = time.perf_counter() - start
+            best = SearchResult(moves_by_code[best_code], scores[best_code], depth, total_nodes, elapsed)
+
+            if info is not None:
+                info(depth, best.score, total_nodes, elapsed, best.move)
+
+            if abs(best.score) >= MATE_THRESHOLD:
+                break
+
+            # Search the best moves first next time, still in a fixed order
+            codes.sort(key=lambda code: -scores[code])
+
+        return best._replace(nodes=total_nodes, time=time.perf_counter() - start)
+
+
+def parallel_search(state, workers=None, max_depth=None, time_limit=None, info=None):
+    """
+    One-off parallel search; starts and stops its own process pool.
+    """
+    with ParallelSearcher(workers) as searcher:
+        return searcher.search(state, max_depth, time_limit, info)
+
+
+def benchmark(state, depth, worker_counts, out=sys.stdout):
+    """
+    Search `state` to `depth` with each worker count and report the
+    speedup over the single-process Searcher. Returns {workers: seconds}.
+    """
+    start = time.perf_counter()
+    base = Searcher(state, max_depth=depth).search()
+    base_time = time.perf_counter() - start
+    out.write("1 process (serial): %.2fs  %d nodes  score %d\n" % (base_time, base.nodes, base.score))
+
+    timings = {}
+    for workers in worker_counts:
+        with ParallelSearcher(workers) as searcher:
+            start = time.perf_counter()
+            result = searcher.search(state, max_depth=depth)
+            elapsed = time.perf_counter() - start
+        timings[workers] = elapsed
+        out.write("%d workers: %.2fs  %d nodes  score %d  speedup %.2fx\n" % (
+            workers, elapsed, result.nodes, result.score, base_time / elapsed))
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel root-splitting search")
+    parser.add_argument("--fen", help="position to search, default is the start position")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    parser.add_argument("--movetime", type=float, help="time limit in seconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--benchmark", action="store_true",
+                        help="report speedup for 1, 2, 4, ... up to --workers processes")
+    args = parser.parse_args(argv)
+
+    state = GameState.from_fen(args.fen) if args.fen else GameState()
+
+    if args.benchmark:
+        counts = []
+        n = 1
+        while n < args.workers:
+            counts.append(n)
+            n *= 2
+        counts.append(args.workers)
+        benchmark(state, args.depth, counts)
+        return 0
+
+    result = parallel_search(state, args.workers, args.depth, args.movetime)
+    print("bestmove %s score %d depth %d nodes %d time %.2fs" % (
+        move_to_uci(*result.move), result.score, result.depth, result.nodes, result.time))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
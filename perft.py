@@ -0,0 +1,149 @@
+import argparse
+import sys
+import time
+
+from game import GameState
+from notation import move_to_uci
+
+# Standard perft positions and their published leaf counts per depth.
+REFERENCE_POSITIONS = [
+    ("startpos",
+     "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete",
+     "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ("position3",
+     "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position4",
+     "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position5",
+     "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+]
+
+def perft(state, depth):
+    """
+    Count the leaf nodes of the legal move tree below `state`.
+    """
+    if depth == 0:
+        return 1
+
+    moves = state.get_legal_moves_with_promotions()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for piece, r, c, promotion in moves:
+        state.make_move(piece, r, c, promotion)
+        nodes += perft(state, depth - 1)
+        state.unmake_move()
+    return nodes
+
+
+def divide(state, depth):
+    """
+    Per root move leaf counts, keyed by move name.
+    """
+    result = {}
+    for piece, r, c, promotion in state.get_legal_moves_with_promotions():
+        name = move_to_uci(piece, r, c, promotion)
+        if depth == 1:
+            result[name] = 1
+            continue
+        state.make_move(piece, r, c, promotion)
+        result[name] = perft(state, depth - 1)
+        state.unmake_move()
+    return result
+
+
+def timed_perft(state, depth):
+    """
+    Returns (nodes, seconds, nodes per second).
+    """
+    start = time.perf_counter()
+    nodes = perft(state, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, nodes / elapsed if elapsed > 0 else 0.0
+
+
+def verify(max_nodes=200000, out=sys.stdout):
+    """
+    Run every reference position up to the deepest depth whose expected
+    count fits in `max_nodes`. Returns True when all counts match.
+    """
+    all_ok = True
+    total_nodes = 0
+    total_time = 0.0
+
+    for name, fen, expected in REFERENCE_POSITIONS:
+        for depth in sorted(expected):
+            if expected[depth] > max_nodes:
+                break
+            state = GameState.from_fen(fen)
+            nodes, elapsed, nps = timed_perft(state, depth)
+            total_nodes += nodes
+            total_time += elapsed
+
+            ok = nodes == expected[depth]
+            all_ok = all_ok and ok
+            out.write("%-10s depth %d  %10d nodes  %8.3fs  %9.0f nps  %s\n" % (
+                name, depth, nodes, elapsed, nps,
+                "ok" if ok else "FAIL (expected %d)" % expected[depth]))
+
+    if total_time > 0:
+        out.write("total %d nodes in %.3fs, %.0f nps\n" % (
+            total_nodes, total_time, total_nodes / total_time))
+    return all_ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft move generator benchmark")
+    parser.add_argument("--fen", help="position to search, default is the start position")
+    parser.add_argument("--position", choices=[p[0] for p in REFERENCE_POSITIONS],
+                        help="use a bundled reference position")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print per-move counts")
+    parser.add_argument("--verify", action="store_true",
+                        help="check all reference positions against their known counts")
+    parser.add_argument("--max-nodes", type=int, default=200000,
+                        help="largest expected count --verify will run")
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        return 0 if verify(args.max_nodes) else 1
+
+    fen = args.fen
+    expected = None
+    if args.position:
+        for name, ref_fen, counts in REFERENCE_POSITIONS:
+            if name == args.position:
+                fen, expected = ref_fen, counts.get(args.depth)
+    if fen is None:
+        fen, expected = REFERENCE_POSITIONS[0][1], REFERENCE_POSITIONS[0][2].get(args.depth)
+
+    state = GameState.from_fen(fen)
+    start = time.perf_counter()
+
+    if args.divide:
+        counts = divide(state, args.depth)
+        for name in sorted(counts):
+            print("%s: %d" % (name, counts[name]))
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(state, args.depth)
+
+    elapsed = time.perf_counter() - start
+    print("nodes %d  time %.3fs  nps %.0f" % (
+        nodes, elapsed, nodes / elapsed if elapsed > 0 else 0.0))
+
+    if expected is not None and nodes != expected:
+        print("MISMATCH: expected %d" % expected)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
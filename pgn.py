@@ -0,0 +1,321 @@
+# Streaming PGN reader.
+#
+# Games are read one at a time from any file-like object, so memory use
+# depends on the longest game and not on the size of the archive. SAN
+# moves are resolved with the pieces' own move generators and
+# GameState.is_legal. For very large files, map_games() splits the file
+# on game boundaries and parses the pieces in a process pool.
+
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+from game import GameState, PROMOTION_PIECES
+from notation import FILES, parse_square, move_to_uci
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+_HEADER = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+
+# Comments, variations, NAGs and move numbers are matched so they can be
+# skipped; anything else that is not whitespace is a move or a result.
+_TOKEN = re.compile(r'\{[^}]*\}?|;[^\n]*|\$\d+|\(|\)|\d+\.+|[^\s{};()$]+')
+
+_SAN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+# A new game starts with a tag line after a blank line
+_GAME_START = re.compile(rb'\n\r?\n\[')
+
+_SPLIT_SCAN_BYTES = 1 << 16
+
+
+class PGNError(ValueError):
+    pass
+
+
+def read_games(f):
+    """
+    Yield (headers, movetext) for each game in `f`, which may be opened
+    in text or binary mode. Nothing is checked beyond the tag syntax.
+    """
+    headers = {}
+    movetext = []
+    in_moves = False
+    # A '[' line inside an unclosed {comment} is not a tag
+    in_comment = False
+
+    for line in f:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        line = line.strip()
+
+        # Escape lines and blank lines carry nothing
+        if not line or line[0] == '%':
+            continue
+
+        if line[0] == '[' and not in_comment:
+            if in_moves:
+                yield headers, "\n".join(movetext)
+                headers = {}
+                movetext = []
+                in_moves = False
+            match = _HEADER.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            continue
+
+        in_moves = True
+        movetext.append(line)
+        if '{' in line or '}' in line:
+            in_comment = line.rfind('{') > line.rfind('}') or (in_comment and '}' not in line)
+
+    if headers or movetext:
+        yield headers, "\n".join(movetext)
+
+
+def parse_movetext(movetext):
+    """
+    Main-line SAN moves of `movetext` and the game result ('*' if none).
+    Comments, NAGs, variations and move numbers are dropped.
+    """
+    sans = []
+    result = "*"
+    depth = 0
+
+    for token in _TOKEN.findall(movetext):
+        first = token[0]
+        if first == '(':
+            depth += 1
+        elif first == ')':
+            depth = max(0, depth - 1)
+        elif depth or first in '{;$' or (first.isdigit() and token[-1] == '.'):
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            sans.append(token)
+
+    return sans, result
+
+
+def san_to_move(state, san):
+    """
+    The legal (piece, row, col, promotion) move that `san` names in
+    `state`. Raises PGNError if there is none or more than one.
+    """
+    # Check marks and annotation glyphs are not needed to find the move
+    name = san.rstrip("+#!?")
+
+    if name in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        col = 6 if len(name) == 3 else 2
+        for (piece, r, c) in state.get_legal_moves():
+            if piece.symbol == 'k' and c == col and piece.col == 4:
+                return (piece, r, c, None)
+        raise PGNError("illegal castling %r in %s" % (san, state.to_fen()))
+
+    match = _SAN.match(name)
+    if not match:
+        raise PGNError("unreadable move %r" % san)
+    letter, from_file, from_rank, target, promotion = match.groups()
+
+    symbol = letter.lower() if letter else 'p'
+    to_row, to_col = parse_square(target)
+    from_col = FILES.index(from_file) if from_file else None
+    from_row = 8 - int(from_rank) if from_rank else None
+
+    # Only pieces of the named kind that reach the target are tried,
+    # which is much cheaper than generating every legal move
+    board = state.board
+    found = None
+    for row in (range(8) if from_row is None else (from_row,)):
+        for piece in (board.grid[row] if from_col is None else (board.grid[row][from_col],)):
+            if piece is None or piece.symbol != symbol or piece.color != state.turn:
+                continue
+            if (to_row, to_col) not in piece.get_moves(board, state):
+                continue
+            if not state.is_legal(piece, to_row, to_col):
+                continue
+            if found is not None:
+                raise PGNError("ambiguous move %r in %s" % (san, state.to_fen()))
+            found = piece
+
+    if found is None:
+        raise PGNError("illegal move %r in %s" % (san, state.to_fen()))
+
+    if symbol == 'p' and (to_row == 0 or to_row == 7):
+        promotion = promotion.lower() if promotion else None
+        if promotion not in PROMOTION_PIECES:
+            raise PGNError("missing promotion piece in %r" % san)
+        return (found, to_row, to_col, promotion)
+    if promotion:
+        raise PGNError("promotion on a non-promoting move %r" % san)
+    return (found, to_row, to_col, None)
+
+
+def start_position(headers):
+    """
+    The starting GameState of a game, honouring a FEN tag.
+    """
+    fen = headers.get("FEN")
+    if fen:
+        try:
+            return GameState.from_fen(fen)
+        except ValueError as e:
+            raise PGNError(str(e))
+    return GameState()
+
+
+def replay(headers, sans):
+    """
+    Play `sans` from the game's start position, yielding the GameState
+    after every ply. The same object is yielded each time and changes
+    in place; call to_fen() or copy what is needed before advancing.
+    """
+    state = start_position(headers)
+    for san in sans:
+        state.make_move(*san_to_move(state, san))
+        yield state
+
+
+def iter_games(f, positions=False, skip_invalid=False):
+    """
+    Yield one entry per game in `f`.
+
+    By default the entry is (headers, moves), with the moves as UCI
+    strings after every SAN move has been checked against the rules.
+    With positions=True it is (headers, plies), where `plies` is a
+    replay() generator over the positions of that game; its moves are
+    checked as it is consumed.
+
+    A game with an illegal or unreadable move raises PGNError, or is
+    left out when skip_invalid is set (positions=False only).
+    """
+    for headers, movetext in read_games(f):
+        sans, result = parse_movetext(movetext)
+        headers.setdefault("Result", result)
+
+        if positions:
+            yield headers, replay(headers, sans)
+            continue
+
+        try:
+            state = start_position(headers)
+            moves = []
+            for san in sans:
+                move = san_to_move(state, san)
+                moves.append(move_to_uci(*move))
+                state.make_move(*move)
+        except PGNError:
+            if skip_invalid:
+                continue
+            raise
+        yield headers, moves
+
+
+def split_file(path, parts):
+    """
+    Cut `path` into at most `parts` (start, end) byte ranges that each
+    begin at the start of a game.
+    """
+    size = os.path.getsize(path)
+    starts = [0]
+
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            offset = max(size * i // parts, starts[-1] + 1)
+            if offset >= size:
+                break
+            start = _next_game_start(f, offset, size)
+            if start is None:
+                break
+            if start > starts[-1]:
+                starts.append(start)
+
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def _next_game_start(f, offset, size):
+    # Back up two bytes so a boundary straddling `offset` is still found
+    pos = max(0, offset - 2)
+    while pos < size:
+        f.seek(pos)
+        block = f.read(_SPLIT_SCAN_BYTES)
+        match = _GAME_START.search(block)
+        if match:
+            return pos + match.end() - 1
+        # Keep the last bytes in case a boundary crosses the block edge
+        pos += max(1, len(block) - 3)
+        if len(block) < _SPLIT_SCAN_BYTES:
+            break
+    return None
+
+
+def _read_range(f, start, end):
+    f.seek(start)
+    pos = start
+    while pos < end:
+        line = f.readline()
+        if not line:
+            break
+        pos += len(line)
+        yield line
+
+
+def _map_range(args):
+    path, start, end, func, skip_invalid = args
+    with open(path, "rb") as f:
+        return [func(headers, moves)
+                for headers, moves in iter_games(_read_range(f, start, end), skip_invalid=skip_invalid)]
+
+
+def map_games(path, func, workers=None, skip_invalid=False):
+    """
+    Yield func(headers, moves) for every game in the file at `path`, as
+    iter_games would, in file order. The file is split on game
+    boundaries and each range is parsed in a separate process, so
+    `func` must be picklable (a module-level function).
+    """
+    workers = workers or os.cpu_count() or 1
+    # Several ranges per worker keep the pool busy and each result list small
+    ranges = split_file(path, workers * 8)
+    tasks = [(path, start, end, func, skip_invalid) for start, end in ranges]
+
+    if workers == 1:
+        for task in tasks:
+            yield from _map_range(task)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        for results in pool.imap(_map_range, tasks):
+            yield from results
+
+
+def _game_length(headers, moves):
+    return len(moves)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate the games of a PGN file")
+    parser.add_argument("path")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--skip-invalid", action="store_true",
+                        help="leave out games with illegal moves instead of stopping")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    games = plies = 0
+    for length in map_games(args.path, _game_length, args.workers, args.skip_invalid):
+        games += 1
+        plies += length
+    elapsed = time.perf_counter() - start
+
+    rate = games / elapsed if elapsed > 0 else 0.0
+    print("%d games, %d plies in %.1fs (%.0f games/s)" % (games, plies, elapsed, rate))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
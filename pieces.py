@@ -1,5 +1,87 @@
+# Per-square target tables, built once at import so move generation and
+# attack tests index them instead of re-creating direction lists and
+# bounds-checking every step. Squares are row * 8 + col and targets are
+# (row, col) tuples that only exist once, so they can be handed out as is.
+# bitboard.py and batcheval.py build their masks from the same steps and
+# directions.
+
+KNIGHT_STEPS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                (1, -2), (1, 2), (2, -1), (2, 1)]
+
+KING_STEPS = [(-1, -1), (-1, 0), (-1, 1), (0, -1),
+              (0, 1), (1, -1), (1, 0), (1, 1)]
+
+# PAWN_CAPTURE_STEPS[color]: the two (dr, dc) a pawn of `color` captures along
+PAWN_CAPTURE_STEPS = {
+    'w': [(-1, -1), (-1, 1)],
+    'b': [(1, -1), (1, 1)],
+}
+
+DIAGONAL_DIRS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+STRAIGHT_DIRS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+
+def _step_targets(steps):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        table.append(tuple((row + dr, col + dc) for dr, dc in steps
+                           if 0 <= row + dr < 8 and 0 <= col + dc < 8))
+    return tuple(table)
+
+
+def _rays(directions):
+    # For each square, one tuple per direction listing the squares
+    # outward from it up to the edge of the board; empty rays are dropped
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        rays = []
+        for dr, dc in directions:
+            ray = []
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                ray.append((r, c))
+                r += dr
+                c += dc
+            if ray:
+                rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return tuple(table)
+
+
+KNIGHT_TARGETS = _step_targets(KNIGHT_STEPS)
+KING_TARGETS = _step_targets(KING_STEPS)
+
+# PAWN_CAPTURES[color][sq]: squares a pawn of `color` on sq attacks
+PAWN_CAPTURES = {color: _step_targets(steps) for color, steps in PAWN_CAPTURE_STEPS.items()}
+
+BISHOP_RAYS = _rays(DIAGONAL_DIRS)
+ROOK_RAYS = _rays(STRAIGHT_DIRS)
+QUEEN_RAYS = tuple(BISHOP_RAYS[sq] + ROOK_RAYS[sq] for sq in range(64))
+
+
+def _slide(rays, grid, color):
+    moves = []
+    for ray in rays:
+        for square in ray:
+            r, c = square
+            target = grid[r][c]
+            if target is None:
+                moves.append(square)
+            else:
+                if target.color != color:
+                    moves.append(square)
+                break
+    return moves
+
+
 # Base class for chess pieces
 class ChessPiece:
+    # No per-instance __dict__; search trees and caches hold a lot of these.
+    # Subclasses declare empty __slots__ to keep it that way.
+    __slots__ = ('color', 'row', 'col', 'has_moved')
+
     def __init__(self, color, row, col):
         self.color = color
         self.row = row
@@ -15,147 +97,61 @@ class ChessPiece:
         self.has_moved = True
 
 class King(ChessPiece):
+    __slots__ = ()
     symbol = 'k'
 
     def get_moves(self, board, game_state=None):
         moves = []
-        row, col = self.row, self.col
+        grid, color = board.grid, self.color
 
         # 8 surrounding squares
-        for dr in range(-1, 2):
-            for dc in range(-1, 2):
-                if dr == dc == 0:
-                    continue
-
-                new_row = row + dr
-                new_col = col + dc
-
-                if not (0 <= new_row < 8 and 0 <= new_col < 8):
-                    continue
-                
-                target = board.grid[new_row][new_col]
-
-
-                if target is None or target.color != self.color:
-                    moves.append((new_row, new_col))
+        for square in KING_TARGETS[self.row * 8 + self.col]:
+            r, c = square
+            target = grid[r][c]
+            if target is None or target.color != color:
+                moves.append(square)
 
         return moves
 
 class Queen(ChessPiece):
+    __slots__ = ()
     symbol = 'q'
 
     def get_moves(self, board, game_state=None):
-        moves = []
-        row, col = self.row, self.col
-
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1),
-                      (-1, 0), (1, 0), (0, -1), (0, 1)]
-
-        for dr, dc in directions:
-            r, c = row + dr, col + dc
-
-            while 0 <= r < 8 and 0 <= c < 8:
-                target = board.grid[r][c]
-
-                if target is None:
-                    moves.append((r, c))
-                else:
-                    if target.color != self.color:
-                        moves.append((r, c))
-                    break 
-
-                r += dr
-                c += dc
-
-        return moves
+        return _slide(QUEEN_RAYS[self.row * 8 + self.col], board.grid, self.color)
 
 class Rook(ChessPiece):
+    __slots__ = ()
     symbol = 'r'
 
     def get_moves(self, board, game_state=None):
-        moves = []
-        row, col = self.row, self.col
-
-        directions = [
-            (-1, 0),  # up
-            (1, 0),   # down
-            (0, -1),  # left
-            (0, 1),   # right
-        ]
-
-        for dr, dc in directions:
-            r, c = row + dr, col + dc
-
-            while 0 <= r < 8 and 0 <= c < 8:
-                target = board.grid[r][c]
-
-                if target is None:
-                    moves.append((r, c))
-                else:
-                    if target.color != self.color:
-                        moves.append((r, c))
-                    break 
-
-                r += dr
-                c += dc
-
-        return moves
+        return _slide(ROOK_RAYS[self.row * 8 + self.col], board.grid, self.color)
 
 class Bishop(ChessPiece):
+    __slots__ = ()
     symbol = 'b'
 
     def get_moves(self, board, game_state=None):
-        moves = []
-        row, col = self.row, self.col
-
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-
-        for dr, dc in directions:
-            r, c = row + dr, col + dc
-
-            while 0 <= r < 8 and 0 <= c < 8:
-                target = board.grid[r][c]
-
-                if target is None:
-                    moves.append((r, c))
-                else:
-                    if target.color != self.color:
-                        moves.append((r, c))
-                    break 
-
-                r += dr
-                c += dc
-
-        return moves
+        return _slide(BISHOP_RAYS[self.row * 8 + self.col], board.grid, self.color)
 
 class Knight(ChessPiece):
+    __slots__ = ()
     symbol = 'n'
 
     def get_moves(self, board, game_state=None):
         moves = []
-        row, col = self.row, self.col
-
-        directions = [
-            (-2, -1), (-2, +1),
-            (-1, -2), (-1, +2),
-            (+1, -2), (+1, +2),
-            (+2, -1), (+2, +1)
-        ]
+        grid, color = board.grid, self.color
 
-        for dr, dc in directions:
-            r, c = row + dr, col + dc
-
-            if not (0 <= r < 8 and 0 <= c < 8):
-                continue
-            
-            target = board.grid[r][c]
-
-            if target is None or target.color != self.color:
-                moves.append((r, c))
+        for square in KNIGHT_TARGETS[self.row * 8 + self.col]:
+            r, c = square
+            target = grid[r][c]
+            if target is None or target.color != color:
+                moves.append(square)
 
         return moves
 
 class Pawn(ChessPiece):
+    __slots__ = ()
     symbol = 'p'
 
     def get_moves(self, board, game_state=None):
@@ -178,15 +174,11 @@ class Pawn(ChessPiece):
                     moves.append((r2, col))
 
         # Capture move
-        for dc in (-1, 1):
-            r, c = row + dr, col + dc
-
-            if not (0 <= r < 8 and 0 <= c < 8):
-                continue
-            
+        for square in PAWN_CAPTURES[color][row * 8 + col]:
+            r, c = square
             target = board.grid[r][c]
-            if target is not None and target.color != self.color:
-                moves.append((r, c))
+            if target is not None and target.color != color:
+                moves.append(square)
 
         # En-passant
         if game_state and game_state.en_passant_target:
@@ -198,3 +190,16 @@ class Pawn(ChessPiece):
                 moves.append((ep_row, ep_col))
 
         return moves
+
+PIECE_CLASSES = {'k': King, 'q': Queen, 'r': Rook, 'b': Bishop, 'n': Knight, 'p': Pawn}
+
+# Small-int piece codes for compact board encodings: 0 is an empty square,
+# white pieces are 1-6 and black pieces are the same code with bit 3 set.
+PIECE_CODES = {
+    (color, symbol): code | (8 if color == 'b' else 0)
+    for code, symbol in enumerate("pnbrqk", 1)
+    for color in "wb"
+}
+
+# code -> (color, symbol)
+CODE_PIECES = {code: key for key, code in PIECE_CODES.items()}
@@ -0,0 +1,252 @@
+# Opt-in instrumentation of the hot paths.
+#
+# Nothing is wrapped until enable() is called, so with profiling off the
+# original methods run untouched and cost nothing extra. enable()
+# replaces each method in HOT_PATHS on its class with a wrapper that
+# counts calls and adds up their time; disable() puts the originals
+# back. Times are inclusive: get_legal_moves includes the
+# is_square_attacked calls made under it.
+#
+# Setting CHESS_PROFILE=report.json turns it on for main.py, uci.py and
+# server.py and writes the report there at exit. Work done in other
+# processes is only counted if they enable profiling themselves and
+# hand their take_stats() to merge_stats(), as server.py's search pool
+# does. `python profiling.py
+# report.json` prints a saved report as a table.
+
+import argparse
+import atexit
+import json
+import os
+import sys
+import time
+from collections import deque
+
+# (module, class, method) of everything enable() wraps
+HOT_PATHS = [
+    ("game", "GameState", "get_legal_moves"),
+    ("game", "GameState", "is_legal"),
+    ("game", "GameState", "is_square_attacked"),
+    ("game", "GameState", "find_king"),
+    ("pieces", "King", "get_moves"),
+    ("pieces", "Queen", "get_moves"),
+    ("pieces", "Rook", "get_moves"),
+    ("pieces", "Bishop", "get_moves"),
+    ("pieces", "Knight", "get_moves"),
+    ("pieces", "Pawn", "get_moves"),
+    ("renderer", "Renderer", "draw_board"),
+    ("renderer", "Renderer", "draw_pieces"),
+    # Normal frames only repaint what changed, through these
+    ("renderer", "Renderer", "draw_frame"),
+    ("renderer", "Renderer", "draw_square"),
+    ("renderer", "Renderer", "draw_status_bar"),
+]
+
+ENV_VAR = "CHESS_PROFILE"
+
+# Frame times kept for percentiles and the report
+FRAME_SAMPLES = 1000
+
+enabled = False
+
+# "Class.method" -> [calls, seconds]
+_stats = {}
+# (class, name, original function) of every wrapped method
+_originals = []
+_frames = deque(maxlen=FRAME_SAMPLES)
+_frame_count = 0
+_frame_start = None
+_enabled_at = None
+
+
+def _wrap(func, stat):
+    perf_counter = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stat[0] += 1
+            stat[1] += perf_counter() - start
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def enable(dump_path=None):
+    """
+    Start counting. Only modules the program has already imported are
+    wrapped, so uci.py and server.py never pull in renderer (and pygame's
+    banner on stdout). With `dump_path`, report() is written there as
+    JSON when the interpreter exits.
+    """
+    global enabled, _enabled_at
+    if enabled:
+        return
+    for module_name, class_name, method in HOT_PATHS:
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+        cls = getattr(module, class_name)
+        # Only methods the class defines itself; inherited ones would be
+        # wrapped twice
+        func = cls.__dict__.get(method)
+        if func is None:
+            continue
+        stat = _stats.setdefault("%s.%s" % (class_name, method), [0, 0.0])
+        _originals.append((cls, method, func))
+        setattr(cls, method, _wrap(func, stat))
+
+    enabled = True
+    _enabled_at = time.perf_counter()
+    if dump_path:
+        atexit.register(dump, dump_path)
+
+
+def disable():
+    global enabled
+    for cls, method, func in _originals:
+        setattr(cls, method, func)
+    _originals.clear()
+    enabled = False
+
+
+def enable_from_env():
+    """
+    enable() with a JSON dump if CHESS_PROFILE names a file.
+    """
+    path = os.environ.get(ENV_VAR)
+    if path:
+        enable(path)
+    return enabled
+
+
+def reset():
+    global _frame_count
+    for stat in _stats.values():
+        stat[0] = 0
+        stat[1] = 0.0
+    _frames.clear()
+    _frame_count = 0
+
+
+def take_stats():
+    """
+    The function counts recorded since the last call, for sending to
+    another process; they are reset here.
+    """
+    taken = {}
+    for name, stat in _stats.items():
+        if stat[0]:
+            taken[name] = (stat[0], stat[1])
+            stat[0] = 0
+            stat[1] = 0.0
+    return taken
+
+
+def merge_stats(taken):
+    """
+    Add counts from take_stats() in another process to this one's.
+    """
+    for name, (calls, seconds) in taken.items():
+        stat = _stats.setdefault(name, [0, 0.0])
+        stat[0] += calls
+        stat[1] += seconds
+
+
+def frame_begin():
+    global _frame_start
+    if enabled:
+        _frame_start = time.perf_counter()
+
+
+def frame_end():
+    """
+    Close the frame opened by frame_begin(). Returns its time in seconds,
+    or None when profiling is off.
+    """
+    global _frame_start, _frame_count
+    if not enabled or _frame_start is None:
+        return None
+    elapsed = time.perf_counter() - _frame_start
+    _frame_start = None
+    _frames.append(elapsed)
+    _frame_count += 1
+    return elapsed
+
+
+def frame_summary():
+    """
+    (last, mean, p95, max) of the recent frame times in milliseconds,
+    or None before the first frame.
+    """
+    if not _frames:
+        return None
+    samples = sorted(_frames)
+    n = len(samples)
+    return (1000 * _frames[-1], 1000 * sum(samples) / n,
+            1000 * samples[min(n - 1, n * 95 // 100)], 1000 * samples[-1])
+
+
+def report():
+    """
+    Everything recorded so far as a JSON-ready dict.
+    """
+    functions = {}
+    for name, (calls, seconds) in sorted(_stats.items()):
+        functions[name] = {
+            "calls": calls,
+            "seconds": round(seconds, 6),
+            "us_per_call": round(1e6 * seconds / calls, 3) if calls else 0.0,
+        }
+
+    result = {
+        "wall_seconds": round(time.perf_counter() - _enabled_at, 3) if _enabled_at else 0.0,
+        "functions": functions,
+    }
+    summary = frame_summary()
+    if summary is not None:
+        last, mean, p95, worst = summary
+        result["frames"] = {
+            "count": _frame_count,
+            "mean_ms": round(mean, 3),
+            "p95_ms": round(p95, 3),
+            "max_ms": round(worst, 3),
+            "recent_ms": [round(1000 * t, 3) for t in _frames],
+        }
+    return result
+
+
+def dump(path):
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=2)
+
+
+def format_report(data):
+    lines = ["%-28s %12s %12s %12s" % ("function", "calls", "seconds", "us/call")]
+    by_time = sorted(data["functions"].items(), key=lambda item: -item[1]["seconds"])
+    for name, stat in by_time:
+        lines.append("%-28s %12d %12.3f %12.2f" % (name, stat["calls"], stat["seconds"], stat["us_per_call"]))
+    frames = data.get("frames")
+    if frames:
+        lines.append("frames %d: mean %.2f ms, p95 %.2f ms, max %.2f ms" % (
+            frames["count"], frames["mean_ms"], frames["p95_ms"], frames["max_ms"]))
+    lines.append("wall %.1fs" % data["wall_seconds"])
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a saved profiling report")
+    parser.add_argument("path", help="JSON written through CHESS_PROFILE")
+    args = parser.parse_args(argv)
+
+    with open(args.path) as f:
+        print(format_report(json.load(f)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
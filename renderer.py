@@ -14,20 +14,29 @@ class Renderer:
         self.font = pygame.font.SysFont("arial", 18)
         self.load_images()
 
+        # Squares, labels and border never change, so render them once
+        self.static_layer = self.build_static_layer()
+
+        # What each square showed when draw_frame last touched it
+        self.drawn_squares = {}
+        self.drawn_status = None
+        self.full_redraw = True
+
     def load_images(self):
         for piece in ['bp','br','bn','bb','bq','bk','wp','wr','wn','wb','wq','wk']:
             img = pygame.image.load(f"images/{piece}.png")
             img = pygame.transform.smoothscale(img, (self.square_size, self.square_size))
             self.images[piece] = img
 
-    def draw_board(self):
-        self.window.fill((235, 209, 166))
-        self.draw_labels()
+    def build_static_layer(self):
+        layer = pygame.Surface(self.window.get_size())
+        layer.fill((235, 209, 166))
+        self.draw_labels(layer)
         for row in range(8):
             for col in range(8):
                 color = (235, 209, 166) if (row + col) % 2 == 0 else (106, 45, 29)
                 pygame.draw.rect(
-                    self.window,
+                    layer,
                     color,
                     (self.board_x + col * self.square_size, self.board_y + row * self.square_size,
                      self.square_size, self.square_size)
@@ -35,7 +44,7 @@ class Renderer:
 
         # Thin black border around the board
         pygame.draw.rect(
-            self.window,
+            layer,
             (0, 0, 0),
             (
                 self.board_x,
@@ -46,27 +55,33 @@ class Renderer:
             1
         )
 
-    def draw_labels(self):
+        return layer
+
+    def draw_board(self):
+        self.window.blit(self.static_layer, (0, 0))
+
+    def draw_labels(self, surface=None):
+        surface = surface or self.window
         files = "abcdefgh"
         for col in range(8):
             letter = self.font.render(files[col], True, (0, 0, 0))
             x = self.board_x + col * self.square_size + self.square_size // 2 - letter.get_width() // 2
 
             # Top
-            self.window.blit(letter, (x, 8))
+            surface.blit(letter, (x, 8))
 
             # Bottom
-            self.window.blit(letter, (x, self.board_y + 8 * self.square_size + 8))
+            surface.blit(letter, (x, self.board_y + 8 * self.square_size + 8))
 
         for row in range(8):
             number = self.font.render(str(8 - row), True, (0, 0, 0))
             y = self.board_y + row * self.square_size + self.square_size // 2 - number.get_height() // 2
 
             # Left
-            self.window.blit(number, (8, y))
+            surface.blit(number, (8, y))
 
             # Right
-            self.window.blit(number, (self.board_x + 8 * self.square_size + 8, y))
+            surface.blit(number, (self.board_x + 8 * self.square_size + 8, y))
 
     def draw_pieces(self):
         for row in range(8):
@@ -80,6 +95,80 @@ class Renderer:
                         (self.board_x + col * self.square_size, self.board_y + row * self.square_size)
                     )
 
+    def square_rect(self, row, col):
+        return pygame.Rect(
+            self.board_x + col * self.square_size, self.board_y + row * self.square_size,
+            self.square_size, self.square_size
+        )
+
+    def draw_square(self, row, col, is_target=False, is_last_move=False, check_color=None):
+        """
+        Redraw one square from the static layer, then its highlights and piece,
+        in the same order a full frame draws them.
+        """
+        rect = self.square_rect(row, col)
+        self.window.blit(self.static_layer, rect, rect)
+
+        if is_target:
+            self.highlight_moves([(row, col)])
+        if is_last_move:
+            self.highlight_square(row, col)
+        if check_color:
+            self.highlight_square(row, col, color=check_color)
+
+        piece = self.board.grid[row][col]
+        if piece:
+            self.window.blit(self.images[piece.color + piece.symbol], rect)
+
+        return rect
+
+    def draw_frame(self, status_text, legal_targets=(), last_move_square=None, check_square=None):
+        """
+        Draw only what changed since the previous call: squares whose piece
+        or highlight differs, and the status bar if its text changed.
+        Returns the dirty rects to pass to pygame.display.update.
+        """
+        dirty = []
+        targets = set(legal_targets)
+
+        if self.full_redraw:
+            self.full_redraw = False
+            self.draw_board()
+            dirty.append(self.window.get_rect())
+
+        for row in range(8):
+            for col in range(8):
+                piece = self.board.grid[row][col]
+                square = (row, col)
+                shown = (
+                    piece.color + piece.symbol if piece else None,
+                    square in targets,
+                    square == last_move_square,
+                    square == check_square,
+                )
+                if self.drawn_squares.get(square) == shown:
+                    continue
+
+                self.drawn_squares[square] = shown
+                dirty.append(self.draw_square(
+                    row, col, shown[1], shown[2], (255, 0, 0) if shown[3] else None
+                ))
+
+        if status_text != self.drawn_status:
+            self.drawn_status = status_text
+            dirty.append(self.draw_status_bar(status_text))
+
+        return dirty
+
+    def invalidate(self):
+        """
+        Make the next draw_frame redraw the whole window, e.g. after an
+        overlay was drawn over the board.
+        """
+        self.drawn_squares = {}
+        self.drawn_status = None
+        self.full_redraw = True
+
     def draw_status_bar(self, text):
         bar_height = 64
         y = self.board_y + 8 * self.square_size
@@ -96,6 +185,21 @@ class Renderer:
         x = self.window.get_width() // 2 - label.get_width() // 2
         self.window.blit(label, (x, y + bar_height // 2 - label.get_height() // 2))
 
+        return pygame.Rect(0, y, self.window.get_width(), bar_height)
+
+    def draw_overlay(self, text):
+        """
+        Small text line in the strip under the status bar, e.g. frame
+        times. Returns its rect.
+        """
+        y = self.board_y + 8 * self.square_size + 64
+        rect = pygame.Rect(0, y, self.window.get_width(), self.window.get_height() - y)
+        self.window.blit(self.static_layer, rect, rect)
+
+        label = self.font.render(text, True, (60, 60, 60))
+        self.window.blit(label, (8, y + rect.height // 2 - label.get_height() // 2))
+        return rect
+
     def highlight_moves(self, moves):
         for r, c in moves:
             if self.board.grid[r][c] is not None:
@@ -0,0 +1,338 @@
+# Negamax alpha-beta search with iterative deepening over GameState.
+
+import time
+from collections import namedtuple
+
+from evaluate import evaluate, PIECE_VALUES
+from game import encode_move
+from tt import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE_SCORE = 100000
+INFINITY = 10 ** 9
+
+# Scores at least this large mean a forced mate was found
+MATE_THRESHOLD = MATE_SCORE - 1000
+
+MAX_DEPTH = 64
+
+# Depth used when no time or node limit is given
+DEFAULT_DEPTH = 4
+
+# Move ordering buckets, best first
+_ORDER_HASH_MOVE = 1 << 30
+_ORDER_CAPTURE = 1 << 28
+_ORDER_KILLER = 1 << 27
+
+# How often (in nodes) the clock is read
+_CHECK_INTERVAL = 1024
+
+# move is (piece, row, col, promotion) or None if there was no legal move
+SearchResult = namedtuple("SearchResult", ["move", "score", "depth", "nodes", "time"])
+
+
+class Searcher:
+    """
+    Searches one GameState in place with make_move/unmake_move.
+
+    Limits are a maximum depth, a time budget in seconds and a node
+    budget; whichever runs out first stops the search, and the result of
+    the deepest completed iteration is returned. Without a time or node
+    limit the depth defaults to DEFAULT_DEPTH. stop() may be called from
+    another thread.
+
+    Pass a TranspositionTable as `tt` to keep it between searches;
+    otherwise each Searcher gets a fresh table of the default size.
+    `root_moves` restricts the search to some of the legal root moves, and
+    `root_window` narrows the (alpha, beta) window at the root.
+    """
+
+    def __init__(self, state, max_depth=None, time_limit=None, node_limit=None, info=None, tt=None,
+                 root_moves=None, root_window=(-INFINITY, INFINITY)):
+        if max_depth is None:
+            max_depth = DEFAULT_DEPTH if time_limit is None and node_limit is None else MAX_DEPTH
+
+        self.state = state
+        self.max_depth = min(max_depth, MAX_DEPTH)
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        # Called as info(depth, score, nodes, seconds, move) after each iteration
+        self.info = info
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.root_moves = root_moves
+        self.root_window = root_window
+
+        self.nodes = 0
+        self.next_check = _CHECK_INTERVAL
+        self.stopped = False
+        self.deadline = None
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.history = {'w': [0] * 4096, 'b': [0] * 4096}
+
+    def stop(self):
+        self.stopped = True
+
+    def search(self):
+        state = self.state
+        start = time.perf_counter()
+        if self.time_limit is not None:
+            self.deadline = start + self.time_limit
+        if self.node_limit is not None:
+            self.next_check = min(self.next_check, self.node_limit)
+        self.tt.new_search()
+
+        root_moves = self.root_moves or state.get_legal_moves_with_promotions()
+        if not root_moves:
+            score = -MATE_SCORE if state.is_in_check(state.turn) else 0
+            return SearchResult(None, score, 0, 0, 0.0)
+
+        # Fall back to the best-ordered move if not even depth 1 finishes
+        entry = self.tt.probe(state.zobrist_key)
+        best_code = entry[0] if entry is not None else None
+        best = SearchResult(self._order(root_moves, 0, best_code)[0], 0, 0, 0, 0.0)
+
+        for depth in range(1, self.max_depth + 1):
+            move, score = self._search_root(root_moves, depth, best_code)
+            if self.stopped:
+                break
+
+            elapsed = time.perf_counter() - start
+            best = SearchResult(move, score, depth, self.nodes, elapsed)
+            best_code = encode_move(move[0].row, move[0].col, move[1], move[2], move[3])
+
+            if self.info is not None:
+                self.info(depth, score, self.nodes, elapsed, move)
+
+            if abs(score) >= MATE_THRESHOLD:
+                break
+
+        return best._replace(nodes=self.nodes, time=time.perf_counter() - start)
+
+    def _search_root(self, moves, depth, best_code):
+        state = self.state
+        root_alpha, beta = self.root_window
+        alpha = root_alpha
+        best_move = None
+        best_score = -INFINITY
+
+        for move in self._order(moves, 0, best_code):
+            state.make_move(*move)
+            score = -self._negamax(depth - 1, -beta, -alpha, 1)
+            state.unmake_move()
+
+            if self.stopped:
+                break
+            if score > best_score or best_move is None:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+
+        if not self.stopped:
+            if best_score <= root_alpha:
+                bound = UPPER
+            elif best_score >= beta:
+                bound = LOWER
+            else:
+                bound = EXACT
+            piece, r, c, promotion = best_move
+            self.tt.store(state.zobrist_key, depth, best_score, bound,
+                          encode_move(piece.row, piece.col, r, c, promotion))
+        return best_move, best_score
+
+    def _negamax(self, depth, alpha, beta, ply):
+        if depth <= 0:
+            return self._quiescence(alpha, beta, ply)
+
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self._check_limits()
+        if self.stopped:
+            return 0
+
+        state = self.state
+        key = state.zobrist_key
+        hash_move = None
+
+        entry = self.tt.probe(key)
+        if entry is not None:
+            hash_move, tt_score, tt_depth, bound = entry
+            if tt_depth >= depth:
+                tt_score = _score_from_tt(tt_score, ply)
+                if bound == EXACT:
+                    return tt_score
+                if bound == LOWER and tt_score >= beta:
+                    return tt_score
+                if bound == UPPER and tt_score <= alpha:
+                    return tt_score
+
+        moves = state.get_legal_moves_with_promotions()
+        if not moves:
+            return -MATE_SCORE + ply if state.is_in_check(state.turn) else 0
+
+        grid = state.board.grid
+        color = state.turn
+        alpha_orig = alpha
+        best = -INFINITY
+        best_code = None
+
+        for move in self._order(moves, ply, hash_move):
+            piece, r, c, promotion = move
+            quiet = grid[r][c] is None and promotion is None
+            code = encode_move(piece.row, piece.col, r, c, promotion)
+
+            state.make_move(piece, r, c, promotion)
+            score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            state.unmake_move()
+
+            if self.stopped:
+                return 0
+
+            if score > best:
+                best = score
+                best_code = code
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    if quiet:
+                        self._store_killer(ply, code)
+                        self.history[color][code & 4095] += depth * depth
+                    break
+
+        if best <= alpha_orig:
+            bound = UPPER
+        elif best >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.tt.store(key, depth, _score_to_tt(best, ply), bound, best_code)
+
+        return best
+
+    def _quiescence(self, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self._check_limits()
+        if self.stopped:
+            return 0
+
+        state = self.state
+        moves = state.get_legal_moves_with_promotions()
+        if not moves:
+            return -MATE_SCORE + ply if state.is_in_check(state.turn) else 0
+
+        stand_pat = evaluate(state)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        grid = state.board.grid
+        ep_target = state.en_passant_target
+        captures = []
+        for move in moves:
+            piece, r, c, promotion = move
+            target = grid[r][c]
+            if target is not None:
+                gain = PIECE_VALUES[target.symbol] * 10 - PIECE_VALUES[piece.symbol] // 10
+            elif promotion is not None:
+                gain = PIECE_VALUES[promotion] * 10
+            elif piece.symbol == 'p' and (r, c) == ep_target:
+                gain = PIECE_VALUES['p'] * 10
+            else:
+                continue
+            captures.append((gain, len(captures), move))
+
+        captures.sort(reverse=True)
+
+        for _, _, move in captures:
+            state.make_move(*move)
+            score = -self._quiescence(-beta, -alpha, ply + 1)
+            state.unmake_move()
+
+            if self.stopped:
+                return 0
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+
+        return alpha
+
+    def _order(self, moves, ply, hash_move):
+        """
+        Hash move first, then captures and promotions by most valuable
+        victim / least valuable attacker, then killers, then quiet moves
+        by history score.
+        """
+        state = self.state
+        grid = state.board.grid
+        ep_target = state.en_passant_target
+        history = self.history[state.turn]
+        killers = self.killers[ply]
+
+        scored = []
+        for i, move in enumerate(moves):
+            piece, r, c, promotion = move
+            code = encode_move(piece.row, piece.col, r, c, promotion)
+            target = grid[r][c]
+
+            if code == hash_move:
+                key = _ORDER_HASH_MOVE
+            elif target is not None or promotion is not None or \
+                    (piece.symbol == 'p' and (r, c) == ep_target):
+                victim = PIECE_VALUES[target.symbol] if target is not None else PIECE_VALUES['p']
+                if promotion is not None:
+                    victim += PIECE_VALUES[promotion]
+                key = _ORDER_CAPTURE + victim * 10 - PIECE_VALUES[piece.symbol] // 10
+            elif code == killers[0] or code == killers[1]:
+                key = _ORDER_KILLER
+            else:
+                key = history[code & 4095]
+
+            # The index keeps the sort stable and never compares moves
+            scored.append((-key, i, move))
+
+        scored.sort()
+        return [move for _, _, move in scored]
+
+    def _store_killer(self, ply, code):
+        killers = self.killers[ply]
+        if killers[0] != code:
+            killers[1] = killers[0]
+            killers[0] = code
+
+    def _check_limits(self):
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            self.stopped = True
+        elif self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stopped = True
+
+        self.next_check = self.nodes + _CHECK_INTERVAL
+        if self.node_limit is not None:
+            self.next_check = min(self.next_check, self.node_limit)
+
+
+def _score_to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+def find_best_move(state, max_depth=None, time_limit=None, node_limit=None, info=None, tt=None):
+    """
+    Best move and score for the side to move, see Searcher.
+    """
+    return Searcher(state, max_depth, time_limit, node_limit, info, tt).search()
@@ -0,0 +1,185 @@
+# Headless self-play: play batches of games between move-selection
+# policies over a process pool, streaming one JSON line per finished game.
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from book import OpeningBook
+from game import GameState
+from notation import move_to_uci
+from search import find_best_move
+
+# A game still running after this many plies is stopped and scored a draw
+DEFAULT_MAX_PLIES = 400
+
+
+def random_policy(state, rng, options):
+    return rng.choice(state.get_legal_moves_with_promotions())
+
+
+def first_legal_policy(state, rng, options):
+    return state.get_legal_moves_with_promotions()[0]
+
+
+# Opening books by path, opened once per worker process
+_books = {}
+
+
+def search_policy(state, rng, options):
+    if options.get("book"):
+        book = _books.get(options["book"])
+        if book is None:
+            book = _books[options["book"]] = OpeningBook(options["book"])
+        move = book.choose(state, rng)
+        if move is not None:
+            return move
+
+    result = find_best_move(
+        state,
+        max_depth=options.get("depth"),
+        time_limit=options.get("movetime"),
+        node_limit=options.get("nodes"),
+    )
+    return result.move
+
+
+# name -> policy(state, rng, options) returning (piece, row, col, promotion)
+POLICIES = {
+    "random": random_policy,
+    "first": first_legal_policy,
+    "search": search_policy,
+}
+
+
+def play_game(game_id, white, black, seed=0, max_plies=DEFAULT_MAX_PLIES, options=None):
+    """
+    Play one game and return its record as a dict.
+    """
+    options = options or {}
+    rng = random.Random(seed * 1000003 + game_id)
+    policies = {'w': POLICIES[white], 'b': POLICIES[black]}
+
+    state = GameState()
+    moves = []
+    move_times = []
+    start = time.perf_counter()
+
+    while True:
+        status = state.get_status()
+        if status == 'checkmate':
+            result = "0-1" if state.turn == 'w' else "1-0"
+            termination = "checkmate"
+            break
+        if status in ('stalemate', 'repetition', 'fifty_moves'):
+            result, termination = "1/2-1/2", status
+            break
+        if len(moves) >= max_plies:
+            result, termination = "1/2-1/2", "max_plies"
+            break
+
+        move_start = time.perf_counter()
+        move = policies[state.turn](state, rng, options)
+        move_times.append(round(time.perf_counter() - move_start, 6))
+
+        moves.append(move_to_uci(*move))
+        state.make_move(*move)
+
+    return {
+        "game": game_id,
+        "white": white,
+        "black": black,
+        "result": result,
+        "termination": termination,
+        "plies": len(moves),
+        "moves": moves,
+        "move_times": move_times,
+        "seconds": round(time.perf_counter() - start, 6),
+    }
+
+
+def _play_game_task(args):
+    return play_game(*args)
+
+
+def completed_games(path):
+    """
+    Ids of the games already in `path`. A line cut short by an interrupted
+    run is dropped from the file so appending starts on a clean line.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+
+    for line in data[:end].splitlines():
+        try:
+            done.add(json.loads(line)["game"])
+        except (ValueError, KeyError):
+            continue
+    return done
+
+
+def run_batch(out_path, games, white="random", black="random", workers=None, seed=0,
+              max_plies=DEFAULT_MAX_PLIES, options=None, resume=True):
+    """
+    Play games 0..games-1 that `out_path` does not already hold, appending
+    each record as soon as its game finishes. Returns the number played.
+    """
+    done = completed_games(out_path) if resume else set()
+    todo = [(game_id, white, black, seed, max_plies, options)
+            for game_id in range(games) if game_id not in done]
+    if not todo:
+        return 0
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, min(16, len(todo) // (workers * 4)))
+
+    with open(out_path, "a" if resume else "w") as out, multiprocessing.Pool(workers) as pool:
+        for record in pool.imap_unordered(_play_game_task, todo, chunksize):
+            out.write(json.dumps(record, separators=(",", ":")) + "\n")
+            out.flush()
+
+    return len(todo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless batch self-play")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--white", choices=sorted(POLICIES), default="random")
+    parser.add_argument("--black", choices=sorted(POLICIES), default="random")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--out", default="selfplay.jsonl")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES)
+    parser.add_argument("--depth", type=int, help="search policy depth")
+    parser.add_argument("--movetime", type=float, help="search policy seconds per move")
+    parser.add_argument("--nodes", type=int, help="search policy nodes per move")
+    parser.add_argument("--book", help="opening book the search policy plays from first")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="overwrite --out instead of skipping games it already holds")
+    args = parser.parse_args(argv)
+
+    options = {"depth": args.depth, "movetime": args.movetime, "nodes": args.nodes, "book": args.book}
+
+    start = time.perf_counter()
+    played = run_batch(args.out, args.games, args.white, args.black, args.workers,
+                       args.seed, args.max_plies, options, not args.no_resume)
+    elapsed = time.perf_counter() - start
+
+    rate = played * 60 / elapsed if elapsed > 0 else 0.0
+    print("played %d games in %.1fs (%.0f games/min)" % (played, elapsed, rate))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
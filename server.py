@@ -0,0 +1,407 @@
+# Asyncio server hosting many headless games over a line protocol.
+#
+# Clients connect over TCP or a Unix socket and send one command per
+# line; every reply is one line. Games live in memory as GameStates and
+# are shared by id, so any connection can join a game and receives a
+# "status" line whenever a move is played in it. Moves are checked and
+# applied on the event loop, which takes well under a millisecond;
+# searches run in a process pool so they never stall other games.
+#
+# Commands (replies start with "ok" or "error"):
+#   new [fen]                 start a game and join it -> ok <id>
+#   join <id> / leave <id>    receive or stop its status lines
+#   move <id> <uci>           play a move, e.g. e2e4 or e7e8q
+#   promote <id> <q|r|b|n>    finish a move played without its piece
+#   go <id> [depth N] [movetime S] [nodes N]
+#                             search in the pool and play the best move
+#   legal <id>                the legal moves
+#   fen <id>                  the position
+#   close <id>                drop the game
+#   stats [id]                games, memory and move latency
+#   quit
+#
+# Pushed to every other connection in a game after each move:
+#   status <id> <uci> <status>
+# where status is check, checkmate, stalemate, repetition, fifty_moves,
+# promotion (waiting for "promote") or none.
+
+import argparse
+import asyncio
+import gc
+import os
+import pickle
+import sys
+import time
+import types
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from game import GameState, encode_move
+from notation import move_to_uci, parse_square, square_name
+import profiling
+from search import Searcher
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7474
+
+# Move latencies kept for the stats command
+LATENCY_SAMPLES = 10000
+
+# Longest accepted command line, in bytes
+MAX_LINE = 4096
+
+_PROMOTIONS = ('q', 'r', 'b', 'n')
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _init_worker(profile):
+    if profile:
+        profiling.enable()
+
+
+def _search_task(state_bytes, max_depth, time_limit, node_limit):
+    """
+    Pool task: search a pickled GameState. Returns (move code, score,
+    depth, nodes, profiling counts), the code being None when there is
+    no legal move.
+    """
+    state = pickle.loads(state_bytes)
+    result = Searcher(state, max_depth, time_limit, node_limit).search()
+    code = None
+    if result.move is not None:
+        piece, row, col, promotion = result.move
+        code = encode_move(piece.row, piece.col, row, col, promotion)
+    stats = profiling.take_stats() if profiling.enabled else None
+    return code, result.score, result.depth, result.nodes, stats
+
+
+def deep_size(obj):
+    """
+    Bytes held by `obj` and everything it references, counting shared
+    objects once and leaving out modules, classes and functions.
+    """
+    skip = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+    seen = set()
+    size = 0
+    todo = [obj]
+    while todo:
+        item = todo.pop()
+        if id(item) in seen or isinstance(item, skip):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        todo.extend(gc.get_referents(item))
+    return size
+
+
+def _rss_bytes():
+    # Current resident set size on Linux, None elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Game:
+    def __init__(self, game_id, state):
+        self.id = game_id
+        self.state = state
+        # Writers of the connections that joined the game
+        self.watchers = set()
+        # Set while a "go" search is running for this game
+        self.busy = False
+
+
+class GameServer:
+    def __init__(self, workers=None):
+        self.games = {}
+        self.next_id = 1
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.moves_played = 0
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    # -- connections -----------------------------------------------------
+
+    async def handle_client(self, reader, writer):
+        joined = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(b"error line too long\n")
+                    break
+                if not line:
+                    break
+
+                args = line.decode("ascii", "replace").split()
+                if not args:
+                    continue
+                if args[0] == "quit":
+                    break
+
+                try:
+                    reply = await self.dispatch(args, writer, joined)
+                except ProtocolError as e:
+                    reply = "error %s" % e
+                writer.write((reply + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for game_id in joined:
+                game = self.games.get(game_id)
+                if game is not None:
+                    game.watchers.discard(writer)
+            writer.close()
+
+    async def dispatch(self, args, writer, joined):
+        command = args[0]
+        if command == "new":
+            return self.cmd_new(args[1:], writer, joined)
+        if command == "stats":
+            return self.cmd_stats(args[1:])
+        if len(args) < 2:
+            raise ProtocolError("usage: %s <id> ..." % command)
+
+        game = self._game(args[1])
+        if command == "join":
+            game.watchers.add(writer)
+            joined.add(game.id)
+            return "ok"
+        if command == "leave":
+            game.watchers.discard(writer)
+            joined.discard(game.id)
+            return "ok"
+        if command == "move":
+            return self.cmd_move(game, args[2:], writer)
+        if command == "promote":
+            return self.cmd_promote(game, args[2:], writer)
+        if command == "go":
+            return await self.cmd_go(game, args[2:], writer)
+        if command == "legal":
+            if game.state.promotion_pending is not None:
+                return "ok"
+            return "ok " + " ".join(move_to_uci(*move) for move in game.state.get_legal_moves_with_promotions())
+        if command == "fen":
+            return "ok " + game.state.to_fen()
+        if command == "close":
+            del self.games[game.id]
+            for watcher in game.watchers:
+                if watcher is not writer:
+                    self._push(watcher, "closed %d" % game.id)
+            joined.discard(game.id)
+            return "ok"
+        raise ProtocolError("unknown command %r" % command)
+
+    def _game(self, text):
+        try:
+            return self.games[int(text)]
+        except (ValueError, KeyError):
+            raise ProtocolError("no game %r" % text) from None
+
+    def _push(self, writer, line):
+        # Status lines are not awaited: a slow watcher must not hold up
+        # the player, and asyncio buffers the write until it drains
+        if not writer.is_closing():
+            writer.write((line + "\n").encode())
+
+    # -- commands --------------------------------------------------------
+
+    def cmd_new(self, args, writer, joined):
+        if args:
+            try:
+                state = GameState.from_fen(" ".join(args))
+            except ValueError as e:
+                raise ProtocolError(str(e)) from None
+        else:
+            state = GameState()
+
+        game = Game(self.next_id, state)
+        self.next_id += 1
+        self.games[game.id] = game
+        game.watchers.add(writer)
+        joined.add(game.id)
+        return "ok %d" % game.id
+
+    def cmd_move(self, game, args, writer):
+        start = time.perf_counter()
+        if len(args) != 1:
+            raise ProtocolError("usage: move <id> <uci>")
+        if game.busy:
+            raise ProtocolError("game %d is searching" % game.id)
+
+        state = game.state
+        if state.promotion_pending is not None:
+            raise ProtocolError("promotion pending")
+
+        text = args[0]
+        try:
+            from_row, from_col = parse_square(text[0:2])
+            to_row, to_col = parse_square(text[2:4])
+        except (ValueError, IndexError):
+            raise ProtocolError("bad move %r" % text) from None
+        # parse_square maps ranks 0 and 9 off the board
+        if len(text) not in (4, 5) or not (0 <= from_row < 8 and 0 <= to_row < 8):
+            raise ProtocolError("bad move %r" % text)
+        promotion = text[4:] or None
+        if promotion is not None and promotion not in _PROMOTIONS:
+            raise ProtocolError("bad promotion %r" % promotion)
+
+        piece = state.board.grid[from_row][from_col]
+        if piece is None or (piece, to_row, to_col) not in state.get_legal_moves():
+            raise ProtocolError("illegal move %s" % text)
+        is_promotion = piece.symbol == 'p' and to_row in (0, 7)
+        if promotion is not None and not is_promotion:
+            raise ProtocolError("illegal move %s" % text)
+
+        # Watchers get the canonical name, not whatever the client sent
+        uci = move_to_uci(piece, to_row, to_col, promotion)
+        state.make_move(piece, to_row, to_col, promotion)
+        return self._played(game, uci, start, writer)
+
+    def cmd_promote(self, game, args, writer):
+        start = time.perf_counter()
+        state = game.state
+        if state.promotion_pending is None:
+            raise ProtocolError("no promotion pending")
+        if len(args) != 1 or args[0] not in _PROMOTIONS:
+            raise ProtocolError("usage: promote <id> <q|r|b|n>")
+
+        pawn = state.promotion_pending[0]
+        record = state.move_history[-1]
+        state.promote_pawn(pawn, args[0])
+        # The pawn already stands on its target, so name the move from the record
+        uci = (square_name(record.from_row, record.from_col) +
+               square_name(record.to_row, record.to_col) + args[0])
+        return self._played(game, uci, start, writer)
+
+    async def cmd_go(self, game, args, writer):
+        if game.busy:
+            raise ProtocolError("game %d is searching" % game.id)
+        if game.state.promotion_pending is not None:
+            raise ProtocolError("promotion pending")
+
+        limits = {"depth": None, "movetime": None, "nodes": None}
+        if len(args) % 2:
+            raise ProtocolError("usage: go <id> [depth N] [movetime S] [nodes N]")
+        for name, value in zip(args[::2], args[1::2]):
+            if name not in limits:
+                raise ProtocolError("unknown limit %r" % name)
+            try:
+                limits[name] = float(value) if name == "movetime" else int(value)
+            except ValueError:
+                raise ProtocolError("bad %s %r" % (name, value)) from None
+
+        if self.pool is None:
+            # Workers profile too when the server does, and send their
+            # counts back with each result
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(profiling.enabled,))
+
+        game.busy = True
+        try:
+            loop = asyncio.get_running_loop()
+            code, score, depth, nodes, stats = await loop.run_in_executor(
+                self.pool, _search_task, pickle.dumps(game.state),
+                limits["depth"], limits["movetime"], limits["nodes"])
+        finally:
+            game.busy = False
+        if stats:
+            profiling.merge_stats(stats)
+
+        if self.games.get(game.id) is not game:
+            raise ProtocolError("game %d was closed" % game.id)
+        move = game.state.move_from_code(code) if code is not None else None
+        if move is None:
+            raise ProtocolError("no legal move")
+
+        start = time.perf_counter()
+        uci = move_to_uci(*move)
+        game.state.make_move(*move)
+        reply = self._played(game, uci, start, writer)
+        return "%s score %d depth %d nodes %d" % (reply, score, depth, nodes)
+
+    def _played(self, game, uci, start, origin):
+        state = game.state
+        if state.promotion_pending is not None:
+            status = "promotion"
+        else:
+            status = state.get_status() or "none"
+
+        line = "status %d %s %s" % (game.id, uci, status)
+        for watcher in game.watchers:
+            # The connection that moved gets the same news in its reply
+            if watcher is not origin:
+                self._push(watcher, line)
+
+        self.moves_played += 1
+        self.latencies.append(time.perf_counter() - start)
+        return "ok %s %s" % (uci, status)
+
+    def cmd_stats(self, args):
+        if args:
+            game = self._game(args[0])
+            return "ok game %d plies %d bytes %d" % (
+                game.id, len(game.state.move_history), deep_size(game.state))
+
+        fields = ["games %d" % len(self.games), "moves %d" % self.moves_played]
+        rss = _rss_bytes()
+        if rss is not None:
+            fields.append("rss %d" % rss)
+            if self.games:
+                fields.append("rss_per_game %d" % (rss // len(self.games)))
+
+        if self.latencies:
+            samples = sorted(self.latencies)
+            n = len(samples)
+            fields.append("move_us mean %.0f p50 %.0f p99 %.0f max %.0f" % (
+                1e6 * sum(samples) / n, 1e6 * samples[n // 2],
+                1e6 * samples[min(n - 1, n * 99 // 100)], 1e6 * samples[-1]))
+        return "ok " + " ".join(fields)
+
+
+async def serve(server, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+    if unix_path:
+        listener = await asyncio.start_unix_server(server.handle_client, unix_path, limit=MAX_LINE)
+        where = unix_path
+    else:
+        listener = await asyncio.start_server(server.handle_client, host, port, limit=MAX_LINE)
+        where = "%s:%d" % (host, port)
+    print("serving on %s" % where, flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many headless games over a line protocol")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="processes for searches started with go")
+    args = parser.parse_args(argv)
+
+    profiling.enable_from_env()
+    server = GameServer(args.workers)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
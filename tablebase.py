@@ -0,0 +1,639 @@
+# Endgame tablebases for three and four pieces, built by retrograde
+# analysis.
+#
+# A table holds one byte per position of a material signature such as
+# "KQvKR": 0 for a draw, otherwise the distance to mate in plies plus
+# one, from the point of view of the side to move. An even distance is
+# a loss (0 is checkmate) and an odd one a win. Positions are indexed
+# directly from the piece squares (white king first, mirrored onto files
+# a-d), so a probe is one index computation and one byte read from a
+# memory-mapped file.
+#
+# Tables assume no castling rights and no en-passant capture; positions
+# with either are not probed. Captures and promotions lead into smaller
+# tables, which are generated first.
+
+import argparse
+import itertools
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+from bitboard import (
+    KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS,
+    bishop_attacks, rook_attacks, queen_attacks, squares,
+)
+from game import GameState
+from notation import move_to_uci
+from zobrist import castling_rights, en_passant_file
+
+MAX_PIECES = 4
+
+MAGIC = b"CGTB"
+VERSION = 1
+
+# magic, version, material signature
+HEADER = struct.Struct("<4sH10s")
+
+DRAW = 0
+INVALID = 255
+
+# Piece letters from strongest to weakest, kings first
+ORDER = "kqrbnp"
+
+# wdl is 1 for a win, 0 for a draw and -1 for a loss of the side to
+# move; plies is the distance to mate, None for draws
+TBResult = namedtuple("TBResult", ["wdl", "plies"])
+
+_PROMOTIONS = "qrbn"
+
+# Frontier positions handed to a worker at a time
+_CHUNK = 4096
+
+
+def parse_signature(signature):
+    """
+    "KQvKR" -> [('w', 'k'), ('w', 'q'), ('b', 'k'), ('b', 'r')]
+    """
+    white, _, black = signature.lower().partition('v')
+    pieces = [('w', symbol) for symbol in white] + [('b', symbol) for symbol in black]
+    if (not white.startswith('k') or not black.startswith('k') or
+            white.count('k') != 1 or black.count('k') != 1 or
+            any(symbol not in ORDER for _, symbol in pieces)):
+        raise ValueError("bad material signature %r" % signature)
+    if len(pieces) > MAX_PIECES:
+        raise ValueError("%r has more than %d pieces" % (signature, MAX_PIECES))
+    return pieces
+
+
+def _side_name(ranks):
+    return "".join(ORDER[rank] for rank in ranks).upper()
+
+
+def canonical(pieces, sqs, stm):
+    """
+    Sort each side's pieces into table order and swap colors (flipping
+    the board) when black has the stronger material. Returns
+    (signature, squares, side to move) for the table that holds the
+    position; stm is 0 for white and 1 for black.
+    """
+    white = sorted((ORDER.index(symbol), sq) for (color, symbol), sq in zip(pieces, sqs) if color == 'w')
+    black = sorted((ORDER.index(symbol), sq) for (color, symbol), sq in zip(pieces, sqs) if color == 'b')
+    white_ranks = [rank for rank, _ in white]
+    black_ranks = [rank for rank, _ in black]
+
+    # More pieces is stronger, then stronger pieces
+    if (len(black), [-rank for rank in black_ranks]) > (len(white), [-rank for rank in white_ranks]):
+        white, black = ([(rank, sq ^ 56) for rank, sq in black],
+                        [(rank, sq ^ 56) for rank, sq in white])
+        white_ranks, black_ranks = black_ranks, white_ranks
+        stm ^= 1
+
+    signature = _side_name(white_ranks) + "v" + _side_name(black_ranks)
+    return signature, [sq for _, sq in white] + [sq for _, sq in black], stm
+
+
+def table_size(count):
+    return 32 * 64 ** (count - 1) * 2
+
+
+def index(sqs, stm):
+    # Mirror so the white king is on files a-d
+    if sqs[0] & 7 >= 4:
+        sqs = [sq ^ 7 for sq in sqs]
+    idx = (sqs[0] >> 3) * 4 + (sqs[0] & 7)
+    for sq in sqs[1:]:
+        idx = idx * 64 + sq
+    return idx * 2 + stm
+
+
+def decode(idx, count):
+    stm = idx & 1
+    idx >>= 1
+    sqs = [0] * count
+    for i in range(count - 1, 0, -1):
+        sqs[i] = idx & 63
+        idx >>= 6
+    sqs[0] = (idx >> 2) * 8 + (idx & 3)
+    return sqs, stm
+
+
+def _attacks(symbol, color, sq, occupied):
+    if symbol == 'n':
+        return KNIGHT_ATTACKS[sq]
+    if symbol == 'k':
+        return KING_ATTACKS[sq]
+    if symbol == 'p':
+        return PAWN_ATTACKS[color][sq]
+    if symbol == 'b':
+        return bishop_attacks(sq, occupied)
+    if symbol == 'r':
+        return rook_attacks(sq, occupied)
+    return queen_attacks(sq, occupied)
+
+
+def _attacked(pieces, sqs, target, by_color, occupied, skip=-1):
+    for i, (color, symbol) in enumerate(pieces):
+        if color == by_color and i != skip and _attacks(symbol, color, sqs[i], occupied) >> target & 1:
+            return True
+    return False
+
+
+def _table_path(directory, signature):
+    return os.path.join(directory, signature + ".tb")
+
+
+class Table:
+    """
+    One memory-mapped table file.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, signature = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("%s is not a version %d tablebase" % (path, VERSION))
+        self.signature = signature.rstrip(b"\0").decode()
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+    def value(self, sqs, stm):
+        return self.mm[HEADER.size + index(sqs, stm)]
+
+
+class Tablebases:
+    """
+    Probes GameState positions against the tables in `directory`,
+    opening each table the first time it is needed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def table(self, signature):
+        """
+        The Table for `signature`, or None if there is no file for it.
+        """
+        if signature not in self.tables:
+            path = _table_path(self.directory, signature)
+            self.tables[signature] = Table(path) if os.path.exists(path) else None
+        return self.tables[signature]
+
+    def value(self, pieces, sqs, stm):
+        """
+        Raw table byte of a position given as piece list and squares,
+        or None if no table covers it.
+        """
+        if len(pieces) == 2:
+            return DRAW
+        signature, sqs, stm = canonical(pieces, sqs, stm)
+        table = self.table(signature)
+        return None if table is None else table.value(sqs, stm)
+
+    def probe(self, state):
+        """
+        TBResult for the side to move, or None when the position has too
+        many pieces, castling rights or an en-passant capture, or its
+        table has not been generated.
+        """
+        pieces = []
+        sqs = []
+        for r, row in enumerate(state.board.grid):
+            for c, piece in enumerate(row):
+                if piece is not None:
+                    pieces.append((piece.color, piece.symbol))
+                    sqs.append(r * 8 + c)
+        if len(pieces) > MAX_PIECES:
+            return None
+        if castling_rights(state.board) or en_passant_file(state) is not None:
+            return None
+
+        value = self.value(pieces, sqs, 0 if state.turn == 'w' else 1)
+        if value is None or value == INVALID:
+            return None
+        return _result(value)
+
+    def best_move(self, state):
+        """
+        The (piece, row, col, promotion) move that keeps the best result:
+        the fastest win, a draw, or the slowest loss. None if the
+        position cannot be probed or has no legal moves.
+        """
+        if self.probe(state) is None:
+            return None
+
+        best = None
+        best_key = None
+        for move in state.get_legal_moves_with_promotions():
+            state.make_move(*move)
+            result = self.probe(state)
+            state.unmake_move()
+            if result is None:
+                return None
+
+            # Our result is the opposite of the opponent's
+            if result.wdl < 0:
+                key = (1, -result.plies)
+            elif result.wdl > 0:
+                key = (-1, result.plies)
+            else:
+                key = (0, 0)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+
+def _result(value):
+    if value == DRAW:
+        return TBResult(0, None)
+    plies = value - 1
+    return TBResult(-1 if plies % 2 == 0 else 1, plies)
+
+
+class _Generator:
+    """
+    Move and unmove generation for one material signature. Sub-tables
+    for captures and promotions are read through `tablebases`.
+    """
+
+    def __init__(self, signature, directory):
+        self.signature = signature
+        self.pieces = parse_signature(signature)
+        self.count = len(self.pieces)
+        self.size = table_size(self.count)
+        self.kings = {'w': 0, 'b': self.pieces.index(('b', 'k'))}
+        self.tablebases = Tablebases(directory)
+
+    def valid(self, sqs, stm):
+        if len(set(sqs)) != self.count:
+            return False
+        for (color, symbol), sq in zip(self.pieces, sqs):
+            if symbol == 'p' and (sq < 8 or sq >= 56):
+                return False
+        occupied = 0
+        for sq in sqs:
+            occupied |= 1 << sq
+        # The side that just moved cannot be in check
+        mover, other = ('b', 'w') if stm == 0 else ('w', 'b')
+        return not _attacked(self.pieces, sqs, sqs[self.kings[mover]], other, occupied)
+
+    def moves(self, sqs, stm):
+        """
+        Yield (same-table index, None) for quiet moves and (None, child
+        value) for captures and promotions, which leave this table.
+        """
+        pieces = self.pieces
+        color, enemy = ('w', 'b') if stm == 0 else ('b', 'w')
+        occupied = own = 0
+        for (c, _), sq in zip(pieces, sqs):
+            occupied |= 1 << sq
+            if c == color:
+                own |= 1 << sq
+        king = self.kings[color]
+
+        for i, (c, symbol) in enumerate(pieces):
+            if c != color:
+                continue
+            sq = sqs[i]
+            if symbol == 'p':
+                step = -8 if color == 'w' else 8
+                targets = PAWN_ATTACKS[color][sq] & occupied & ~own
+                one = sq + step
+                if not occupied >> one & 1:
+                    targets |= 1 << one
+                    start_row = 6 if color == 'w' else 1
+                    if sq >> 3 == start_row and not occupied >> (one + step) & 1:
+                        targets |= 1 << (one + step)
+            else:
+                targets = _attacks(symbol, color, sq, occupied) & ~own
+
+            for to in squares(targets):
+                captured = -1
+                if occupied >> to & 1:
+                    captured = sqs.index(to)
+                child = list(sqs)
+                child[i] = to
+                child_occupied = occupied & ~(1 << sq) | 1 << to
+                if _attacked(pieces, child, child[king], enemy, child_occupied, captured):
+                    continue
+
+                promotion = symbol == 'p' and (to < 8 or to >= 56)
+                if captured < 0 and not promotion:
+                    yield index(child, stm ^ 1), None
+                    continue
+
+                child_pieces = list(pieces)
+                if captured >= 0:
+                    del child_pieces[captured]
+                    del child[captured]
+                    mover = i if captured > i else i - 1
+                else:
+                    mover = i
+                for new_symbol in (_PROMOTIONS if promotion else (symbol,)):
+                    child_pieces[mover] = (color, new_symbol)
+                    yield None, self.tablebases.value(child_pieces, child, stm ^ 1)
+
+    def unmoves(self, sqs, stm):
+        """
+        Yield the indices of positions in this table from which a quiet
+        move reaches (sqs, stm).
+        """
+        color = 'b' if stm == 0 else 'w'
+        occupied = 0
+        for sq in sqs:
+            occupied |= 1 << sq
+
+        for i, (c, symbol) in enumerate(self.pieces):
+            if c != color:
+                continue
+            sq = sqs[i]
+            if symbol == 'p':
+                step = 8 if color == 'w' else -8
+                sources = 0
+                back = sq + step
+                if 0 <= back < 64 and not occupied >> back & 1:
+                    sources |= 1 << back
+                    double_row = 4 if color == 'w' else 3
+                    if sq >> 3 == double_row and not occupied >> (back + step) & 1:
+                        sources |= 1 << (back + step)
+            else:
+                sources = _attacks(symbol, color, sq, occupied) & ~occupied
+
+            for source in squares(sources):
+                parent = list(sqs)
+                parent[i] = source
+                yield index(parent, stm ^ 1)
+
+
+# Per-process generator, rebuilt when a worker moves on to another table
+_worker_generator = None
+
+
+def _generator(signature, directory):
+    global _worker_generator
+    if _worker_generator is None or _worker_generator.signature != signature:
+        _worker_generator = _Generator(signature, directory)
+    return _worker_generator
+
+
+def _scan_range(args):
+    """
+    First pass over indices start..end-1: mark invalid positions, count
+    the quiet moves of each position and score its captures and
+    promotions. Returns (values, counts, conversion, seeds), where seeds
+    are (level, index) pairs of positions decided at that level unless
+    something faster turns up.
+    """
+    signature, directory, start, end = args
+    gen = _generator(signature, directory)
+    count = gen.count
+
+    values = bytearray(end - start)
+    counts = bytearray(end - start)
+    # Loss distance if every capture and promotion loses, or INVALID if
+    # one of them draws or wins, so the position can never be lost
+    conversion = bytearray(end - start)
+    seeds = []
+
+    for idx in range(start, end):
+        sqs, stm = decode(idx, count)
+        i = idx - start
+        if not gen.valid(sqs, stm):
+            values[i] = INVALID
+            continue
+
+        quiet = 0
+        any_move = False
+        win = None
+        loss = 0
+        drawn = False
+        for child_index, child_value in gen.moves(sqs, stm):
+            any_move = True
+            if child_index is not None:
+                quiet += 1
+            elif child_value is None or child_value == INVALID:
+                raise RuntimeError("%s needs a missing sub-table" % signature)
+            elif child_value == DRAW:
+                drawn = True
+            elif child_value % 2 == 1:
+                # The opponent is mated in child_value - 1 plies
+                win = child_value if win is None else min(win, child_value)
+            else:
+                loss = max(loss, child_value)
+
+        if not any_move:
+            king = sqs[gen.kings['wb'[stm]]]
+            if _attacked(gen.pieces, sqs, king, 'bw'[stm], sum(1 << sq for sq in sqs)):
+                seeds.append((0, idx))
+            else:
+                conversion[i] = INVALID
+            continue
+
+        counts[i] = quiet
+        if win is not None:
+            seeds.append((win, idx))
+        if win is not None or drawn:
+            conversion[i] = INVALID
+        else:
+            conversion[i] = loss
+            if quiet == 0:
+                seeds.append((loss, idx))
+
+    return bytes(values), bytes(counts), bytes(conversion), seeds
+
+
+def _unmove_chunk(args):
+    """
+    Predecessors of all the positions in `indices`, in one array.
+    """
+    signature, directory, indices = args
+    gen = _generator(signature, directory)
+    count = gen.count
+    found = array('Q')
+    for idx in indices:
+        sqs, stm = decode(idx, count)
+        found.extend(gen.unmoves(sqs, stm))
+    return found
+
+
+def generate(signature, directory, workers=None, log=None):
+    """
+    Build the table for `signature` in `directory`, generating the
+    tables it converts into first. Existing tables are kept.
+    Returns the path of the table file.
+    """
+    pieces = parse_signature(signature)
+    signature, _, _ = canonical(pieces, list(range(len(pieces))), 0)
+    path = _table_path(directory, signature)
+    if os.path.exists(path):
+        return path
+
+    for sub in sorted(_subtables(pieces)):
+        generate(sub, directory, workers, log)
+
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    start_time = time.perf_counter()
+    if log:
+        log("%s: scanning" % signature)
+
+    size = table_size(len(pieces))
+    values = bytearray(size)
+    counts = bytearray(size)
+    conversion = bytearray(size)
+    buckets = {}
+
+    step = max(1, -(-size // (workers * 16)))
+    ranges = [(signature, directory, lo, min(size, lo + step)) for lo in range(0, size, step)]
+
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        scan = pool.imap(_scan_range, ranges) if pool else map(_scan_range, ranges)
+        for (_, _, lo, hi), (part_values, part_counts, part_conversion, seeds) in zip(ranges, scan):
+            values[lo:hi] = part_values
+            counts[lo:hi] = part_counts
+            conversion[lo:hi] = part_conversion
+            for level, idx in seeds:
+                buckets.setdefault(level, []).append(idx)
+
+        # Retrograde pass: positions decided at `level` decide their
+        # predecessors at level + 1 or later
+        level = 0
+        while buckets:
+            frontier = []
+            for idx in buckets.pop(level, ()):
+                if values[idx] == DRAW:
+                    values[idx] = level + 1
+                    frontier.append(idx)
+
+            chunks = [(signature, directory, frontier[i:i + _CHUNK])
+                      for i in range(0, len(frontier), _CHUNK)]
+            results = pool.imap(_unmove_chunk, chunks) if pool else map(_unmove_chunk, chunks)
+            for found in results:
+                for parent in found:
+                    if values[parent] != DRAW:
+                        continue
+                    if level % 2 == 0:
+                        # The child is lost for its side to move: a win for us
+                        buckets.setdefault(level + 1, []).append(parent)
+                    elif conversion[parent] != INVALID:
+                        counts[parent] -= 1
+                        if counts[parent] == 0:
+                            buckets.setdefault(max(level + 1, conversion[parent]), []).append(parent)
+            level += 1
+            if level >= INVALID - 1 and buckets:
+                raise RuntimeError("%s: distance to mate does not fit in a byte" % signature)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    temp = path + ".part"
+    with open(temp, "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION, signature.encode()))
+        out.write(values)
+    os.replace(temp, path)
+
+    if log:
+        log("%s: %d positions in %.1fs, longest mate %d plies" % (
+            signature, size, time.perf_counter() - start_time, max(0, level - 1)))
+    return path
+
+
+def _subtables(pieces):
+    """
+    Signatures reachable from `pieces` by one capture or promotion.
+    """
+    found = set()
+    for i, (color, symbol) in enumerate(pieces):
+        if symbol == 'k':
+            continue
+        rest = pieces[:i] + pieces[i + 1:]
+        if len(rest) > 2:
+            found.add(canonical(rest, list(range(len(rest))), 0)[0])
+        if symbol == 'p':
+            for promotion in _PROMOTIONS:
+                promoted = list(pieces)
+                promoted[i] = (color, promotion)
+                found.add(canonical(promoted, list(range(len(promoted))), 0)[0])
+    return found
+
+
+def all_signatures(count):
+    """
+    Every table signature with exactly `count` pieces.
+    """
+    found = set()
+    for extra in itertools.combinations_with_replacement(ORDER[1:], count - 2):
+        for split in range(len(extra) + 1):
+            for white in itertools.combinations(extra, split):
+                black = list(extra)
+                for symbol in white:
+                    black.remove(symbol)
+                pieces = ([('w', 'k')] + [('w', s) for s in white] +
+                          [('b', 'k')] + [('b', s) for s in black])
+                found.add(canonical(pieces, list(range(count)), 0)[0])
+    return sorted(found, key=lambda s: (len(s), s))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    parser.add_argument("--dir", default="tablebases", help="table directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen_parser = sub.add_parser("generate", help="build tables, e.g. KQvK KRvKP")
+    gen_parser.add_argument("signatures", nargs="*")
+    gen_parser.add_argument("--all", type=int, choices=(3, 4), help="every table with this many pieces")
+    gen_parser.add_argument("--workers", type=int, default=os.cpu_count())
+
+    probe_parser = sub.add_parser("probe", help="look up a position")
+    probe_parser.add_argument("fen")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        signatures = list(args.signatures)
+        if args.all:
+            signatures += all_signatures(args.all)
+        for signature in signatures:
+            generate(signature, args.dir, args.workers, log=print)
+        return 0
+
+    state = GameState.from_fen(args.fen)
+    with Tablebases(args.dir) as tablebases:
+        result = tablebases.probe(state)
+        if result is None:
+            print("not in the tablebases")
+            return 1
+        move = tablebases.best_move(state)
+        outcome = {1: "win", 0: "draw", -1: "loss"}[result.wdl]
+        if result.plies is not None:
+            outcome += " in %d plies" % result.plies
+        print("%s, best move %s" % (outcome, move_to_uci(*move) if move else "none"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
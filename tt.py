@@ -0,0 +1,114 @@
+# Fixed-size transposition table keyed by GameState.zobrist_key.
+#
+# Every slot is two 64-bit words: the position key XORed with the data
+# word, and the data word itself. A torn or colliding write then simply
+# fails the key check, which lets several processes share one table
+# without locks. Slots are paired into buckets: the first slot keeps the
+# deepest entry of the current search, the second is always replaced.
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+SLOT_BYTES = 16
+BUCKET_SLOTS = 2
+
+DEFAULT_SIZE_MB = 16
+
+# Data word layout, low bits first
+_MOVE_MASK = 0xFFFF
+_DEPTH_SHIFT = 16      # depth + 1, so a used slot never has all-zero data
+_BOUND_SHIFT = 24
+_AGE_SHIFT = 26
+_AGE_MASK = 63
+_SCORE_SHIFT = 32
+_SCORE_OFFSET = 1 << 31
+
+
+def table_bytes(size_mb):
+    """
+    Bytes needed for a table of `size_mb` megabytes: the largest power of
+    two number of buckets that fits, but at least one bucket.
+    """
+    buckets = max(1, size_mb * 1024 * 1024 // (SLOT_BYTES * BUCKET_SLOTS))
+    buckets = 1 << (buckets.bit_length() - 1)
+    return buckets * SLOT_BYTES * BUCKET_SLOTS
+
+
+class TranspositionTable:
+    """
+    A table never grows: its memory is fixed when it is created, either
+    from `size_mb` or from a caller-supplied writable `buffer` (for
+    example shared memory) whose length comes from table_bytes().
+    """
+
+    def __init__(self, size_mb=DEFAULT_SIZE_MB, buffer=None):
+        if buffer is None:
+            buffer = bytearray(table_bytes(size_mb))
+        self.raw = memoryview(buffer).cast('B')
+        self.words = self.raw.cast('Q')
+        self.bucket_mask = len(self.words) // (2 * BUCKET_SLOTS) - 1
+        self.age = 0
+
+    @property
+    def size_bytes(self):
+        return len(self.words) * 8
+
+    def new_search(self):
+        """
+        Age existing entries so the next search prefers its own.
+        """
+        self.age = (self.age + 1) & _AGE_MASK
+
+    def clear(self):
+        self.raw[:] = bytes(len(self.raw))
+        self.age = 0
+
+    def probe(self, key):
+        """
+        Returns (move, score, depth, bound) for `key`, or None.
+        """
+        words = self.words
+        i = (key & self.bucket_mask) * 4
+        for j in (i, i + 2):
+            data = words[j + 1]
+            if data and words[j] ^ data == key:
+                return (data & _MOVE_MASK,
+                        (data >> _SCORE_SHIFT) - _SCORE_OFFSET,
+                        (data >> _DEPTH_SHIFT & 0xFF) - 1,
+                        data >> _BOUND_SHIFT & 3)
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        words = self.words
+        i = (key & self.bucket_mask) * 4
+
+        data = ((score + _SCORE_OFFSET) << _SCORE_SHIFT |
+                self.age << _AGE_SHIFT |
+                bound << _BOUND_SHIFT |
+                (depth + 1) << _DEPTH_SHIFT |
+                (move or 0))
+
+        # Depth-preferred slot: take it for the same position, a deeper
+        # search, or an entry left over from an older search.
+        old = words[i + 1]
+        if (not old or words[i] ^ old == key or
+                depth >= (old >> _DEPTH_SHIFT & 0xFF) - 1 or
+                (old >> _AGE_SHIFT & _AGE_MASK) != self.age):
+            words[i] = key ^ data
+            words[i + 1] = data
+            return
+
+        words[i + 2] = key ^ data
+        words[i + 3] = data
+
+    def hashfull(self):
+        """
+        Per-mille of sampled slots used by the current search.
+        """
+        words = self.words
+        sample = min(1000, len(words) // 2)
+        used = 0
+        for j in range(sample):
+            data = words[2 * j + 1]
+            if data and (data >> _AGE_SHIFT & _AGE_MASK) == self.age:
+                used += 1
+        return used * 1000 // sample
@@ -0,0 +1,328 @@
+# UCI front-end: speaks the Universal Chess Interface on stdin/stdout so
+# GUIs, tournament managers and analysis tools can drive the engine.
+#
+# The search runs on a background thread and the main thread keeps
+# reading commands, so "stop" and "ponderhit" act while it thinks;
+# Searcher looks at its stop flag on every node. "position" commands
+# that extend (or take back moves from) the previous one are applied
+# with make_move/unmake_move instead of rebuilding the GameState.
+
+import sys
+import threading
+import time
+
+from game import GameState, encode_move
+from notation import move_to_uci, parse_square
+import profiling
+from search import Searcher, MATE_SCORE, MATE_THRESHOLD, MAX_DEPTH
+from tt import TranspositionTable, DEFAULT_SIZE_MB
+
+ENGINE_NAME = "pythonChessGame"
+ENGINE_AUTHOR = "pythonChessGame developers"
+
+# Time budget when a move has to come from the clock: a share of the
+# remaining time plus most of the increment, kept clear of the flag
+DEFAULT_MOVES_TO_GO = 30
+MOVE_OVERHEAD = 0.05
+INCREMENT_SHARE = 0.8
+
+
+def parse_uci_move(state, text):
+    """
+    The (piece, row, col, promotion) move named by `text` in `state`,
+    or None if it is malformed or not legal.
+    """
+    if len(text) not in (4, 5) or (len(text) == 5 and text[4] not in "qrbn"):
+        return None
+    try:
+        from_row, from_col = parse_square(text[0:2])
+        to_row, to_col = parse_square(text[2:4])
+    except ValueError:
+        return None
+    if not (0 <= from_row < 8 and 0 <= to_row < 8):
+        return None
+    return state.move_from_code(encode_move(from_row, from_col, to_row, to_col, text[4:5] or None))
+
+
+def time_budget(turn, limits):
+    """
+    Seconds to spend on a move under the "go" `limits`, or None when
+    neither movetime nor the side to move's clock is given.
+    """
+    if limits.get("movetime") is not None:
+        return max(0.001, limits["movetime"] / 1000.0 - MOVE_OVERHEAD)
+
+    remaining = limits.get("wtime" if turn == 'w' else "btime")
+    if remaining is None:
+        return None
+    remaining /= 1000.0
+    increment = limits.get("winc" if turn == 'w' else "binc", 0) / 1000.0
+    moves_to_go = limits.get("movestogo") or DEFAULT_MOVES_TO_GO
+
+    budget = remaining / moves_to_go + increment * INCREMENT_SHARE
+    return max(0.001, min(budget, remaining / 2 - MOVE_OVERHEAD))
+
+
+def format_score(score):
+    if abs(score) >= MATE_THRESHOLD:
+        plies = MATE_SCORE - abs(score)
+        moves = (plies + 1) // 2
+        return "mate %d" % (moves if score > 0 else -moves)
+    return "cp %d" % score
+
+
+class UCIEngine:
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.out_lock = threading.Lock()
+
+        self.state = GameState()
+        # What the current state was built from: a FEN, or None for the
+        # start position, plus the moves played on top of it
+        self.base = None
+        self.moves = []
+
+        self.hash_mb = DEFAULT_SIZE_MB
+        self.tt = TranspositionTable(self.hash_mb)
+
+        self.searcher = None
+        self.thread = None
+        # Set by stop/ponderhit; until then an infinite or pondering
+        # search holds back its bestmove even if it finished early
+        self.release = threading.Event()
+        self.pending_budget = None
+
+    def send(self, line):
+        with self.out_lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    # -- commands --------------------------------------------------------
+
+    def handle(self, line):
+        """
+        Run one command line. Returns False on "quit".
+        """
+        args = line.split()
+        if not args:
+            return True
+        command = args[0]
+
+        if command == "uci":
+            self.send("id name %s" % ENGINE_NAME)
+            self.send("id author %s" % ENGINE_AUTHOR)
+            self.send("option name Hash type spin default %d min 1 max 4096" % DEFAULT_SIZE_MB)
+            self.send("option name Ponder type check default false")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.wait()
+            self.set_option(args[1:])
+        elif command == "ucinewgame":
+            self.wait()
+            self.tt.clear()
+            self.set_position(None, [])
+        elif command == "position":
+            self.wait()
+            self.position(args[1:])
+        elif command == "go":
+            self.wait()
+            self.go(args[1:])
+        elif command == "stop":
+            self.stop()
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "quit":
+            self.stop()
+            return False
+        # Anything else (debug, register, unknown) is ignored as UCI asks
+        return True
+
+    def set_option(self, args):
+        if "name" not in args:
+            return
+        value_at = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:value_at]).lower()
+        value = " ".join(args[value_at + 1:])
+
+        if name == "hash":
+            try:
+                size_mb = max(1, int(value))
+            except ValueError:
+                return
+            self.hash_mb = size_mb
+            self.tt = TranspositionTable(size_mb)
+
+    def position(self, args):
+        if not args:
+            return
+        moves_at = args.index("moves") if "moves" in args else len(args)
+        if args[0] == "startpos":
+            base = None
+        elif args[0] == "fen":
+            base = " ".join(args[1:moves_at])
+        else:
+            return
+        self.set_position(base, args[moves_at + 1:])
+
+    def set_position(self, base, moves):
+        """
+        Bring self.state to `base` plus `moves`. When the base is the
+        same, only the moves that differ from the last position are
+        taken back and played.
+        """
+        if base != self.base:
+            try:
+                state = GameState.from_fen(base) if base is not None else GameState()
+            except ValueError as e:
+                self.send("info string %s" % e)
+                return
+            self.state, self.base, self.moves = state, base, []
+
+        common = 0
+        while common < min(len(moves), len(self.moves)) and moves[common] == self.moves[common]:
+            common += 1
+        while len(self.moves) > common:
+            self.state.unmake_move()
+            self.moves.pop()
+
+        for text in moves[common:]:
+            move = parse_uci_move(self.state, text)
+            if move is None:
+                self.send("info string illegal move %s" % text)
+                return
+            self.state.make_move(*move)
+            self.moves.append(text)
+
+    def go(self, args):
+        limits = {}
+        flags = {"infinite", "ponder"}
+        i = 0
+        while i < len(args):
+            name = args[i]
+            if name in flags:
+                limits[name] = True
+                i += 1
+                continue
+            if name == "searchmoves":
+                # Moves to the end of the line restrict the root
+                limits[name] = args[i + 1:]
+                break
+            if i + 1 < len(args):
+                try:
+                    limits[name] = int(args[i + 1])
+                except ValueError:
+                    pass
+            i += 2
+
+        root_moves = None
+        if limits.get("searchmoves"):
+            root_moves = [move for move in (parse_uci_move(self.state, text)
+                                            for text in limits["searchmoves"]) if move]
+
+        budget = time_budget(self.state.turn, limits)
+        held = limits.get("infinite") or limits.get("ponder")
+        self.release.clear()
+        if not held:
+            self.release.set()
+        # A ponder search runs untimed until ponderhit starts the clock
+        self.pending_budget = budget if limits.get("ponder") else None
+
+        depth = limits.get("depth")
+        if held and depth is None and limits.get("nodes") is None:
+            # Infinite and pondering searches go until told otherwise
+            depth = MAX_DEPTH
+
+        self.searcher = Searcher(
+            self.state,
+            max_depth=depth,
+            time_limit=None if held else budget,
+            node_limit=limits.get("nodes"),
+            info=self._info,
+            tt=self.tt,
+            root_moves=root_moves or None,
+        )
+        self.thread = threading.Thread(target=self._run, args=(self.searcher,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.searcher is not None:
+            self.searcher.stop()
+        self.release.set()
+        self.wait()
+
+    def ponderhit(self):
+        # The expected move was played: the ponder search carries on as
+        # a normal timed search
+        searcher = self.searcher
+        if searcher is None:
+            return
+        budget = self.pending_budget
+        if budget is not None:
+            searcher.time_limit = budget
+            searcher.deadline = time.perf_counter() + budget
+        self.release.set()
+
+    def wait(self):
+        """
+        Let a running search finish and report, so commands that touch
+        the position never see it mid-search. Only stop, a limit or
+        ponderhit ends a search, so callers stop it first when needed.
+        """
+        thread = self.thread
+        if thread is not None:
+            if not self.release.is_set():
+                # A GUI that sends a new command without stopping
+                # still expects a bestmove for the old search
+                self.searcher.stop()
+                self.release.set()
+            thread.join()
+            self.thread = None
+            self.searcher = None
+
+    # -- search thread ---------------------------------------------------
+
+    def _run(self, searcher):
+        result = searcher.search()
+        self.release.wait()
+
+        if result.move is None:
+            self.send("bestmove 0000")
+            return
+
+        line = "bestmove " + move_to_uci(*result.move)
+        ponder = self._ponder_move(result.move)
+        if ponder is not None:
+            line += " ponder " + ponder
+        self.send(line)
+
+    def _ponder_move(self, move):
+        # The reply the search expects, read from the transposition table
+        state = self.state
+        state.make_move(*move)
+        try:
+            entry = self.tt.probe(state.zobrist_key)
+            reply = state.move_from_code(entry[0]) if entry is not None and entry[0] else None
+            return move_to_uci(*reply) if reply is not None else None
+        finally:
+            state.unmake_move()
+
+    def _info(self, depth, score, nodes, seconds, move):
+        nps = int(nodes / seconds) if seconds > 0 else 0
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (
+            depth, format_score(score), nodes, nps, int(seconds * 1000), move_to_uci(*move)))
+
+
+def main():
+    profiling.enable_from_env()
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
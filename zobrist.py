@@ -0,0 +1,97 @@
+# Zobrist hashing for GameState positions.
+#
+# The keys come from a fixed seed so the same position hashes to the
+# same 64-bit value in every process and every run.
+
+import random
+
+_rng = random.Random(0x5A0B1157)
+
+
+def _random64():
+    return _rng.getrandbits(64)
+
+
+# PIECE_KEYS[color][symbol][row * 8 + col]
+PIECE_KEYS = {
+    color: {symbol: [_random64() for _ in range(64)] for symbol in "kqrbnp"}
+    for color in "wb"
+}
+
+# XORed in when black is to move
+SIDE_KEY = _random64()
+
+# One key per castling-rights mask, see castling_rights()
+CASTLING_KEYS = [_random64() for _ in range(16)]
+
+EN_PASSANT_KEYS = [_random64() for _ in range(8)]
+
+# (bit, king color, row, rook column) for K, Q, k, q
+CASTLING_SQUARES = (
+    (1, 'w', 7, 7),
+    (2, 'w', 7, 0),
+    (4, 'b', 0, 7),
+    (8, 'b', 0, 0),
+)
+
+
+def castling_rights(board):
+    """
+    Castling rights as a 4-bit mask (K=1, Q=2, k=4, q=8), derived from
+    the has_moved flags of the kings and rooks on their home squares.
+    """
+    grid = board.grid
+    rights = 0
+    for mask, color, row, rook_col in CASTLING_SQUARES:
+        king = grid[row][4]
+        if king is None or king.has_moved or king.symbol != 'k' or king.color != color:
+            continue
+        rook = grid[row][rook_col]
+        if rook is None or rook.has_moved or rook.symbol != 'r' or rook.color != color:
+            continue
+        rights |= mask
+    return rights
+
+
+def en_passant_file(state):
+    """
+    Column of the en-passant target, but only when a pawn of the side to
+    move can actually capture there; otherwise None. This keeps the key
+    identical for positions that only differ by a useless target.
+    """
+    target = state.en_passant_target
+    if target is None:
+        return None
+
+    row, col = target
+    pawn_row = row + 1 if state.turn == 'w' else row - 1
+    grid = state.board.grid
+    for c in (col - 1, col + 1):
+        if 0 <= c < 8:
+            piece = grid[pawn_row][c]
+            if piece is not None and piece.symbol == 'p' and piece.color == state.turn:
+                return col
+    return None
+
+
+def en_passant_key(state):
+    col = en_passant_file(state)
+    return 0 if col is None else EN_PASSANT_KEYS[col]
+
+
+def compute_key(state):
+    """
+    Full O(64) key computation. GameState keeps `zobrist_key` up to date
+    incrementally; this is the reference it is checked against.
+    """
+    key = 0
+    for r, row in enumerate(state.board.grid):
+        for c, piece in enumerate(row):
+            if piece is not None:
+                key ^= PIECE_KEYS[piece.color][piece.symbol][r * 8 + c]
+
+    if state.turn == 'b':
+        key ^= SIDE_KEY
+    key ^= CASTLING_KEYS[castling_rights(state.board)]
+    key ^= en_passant_key(state)
+    return key